@@ -1,18 +1,28 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 from contextlib import asynccontextmanager
-import threading
 import asyncio
+import json
+import os
+from typing import List
 
 # Import the new simplified modules
-from telegram_reader import get_telegram_messages
-from rag_arabert import generate_response
-from vector_store import init_vector_store, upsert_articles, search
+from telegram_reader import get_telegram_service, shutdown_telegram_service, telegram_stats
+from verdict_cache import cached_agenerate_response, cached_astream_response, verdict_cache_stats
+from vector_store import init_vector_store, close_vector_store, search, search_many, cache_stats
+from llm_client import LLM_MAX_CONCURRENCY
+from inference_pool import InferenceSaturated, get_inference_executor
+from ingest_jobs import IngestQueueFull, get_ingest_queue, shutdown_ingest_queue
 from news_fetchers import fetch_all_external
 from urllib.parse import urlparse
 
 
+# TELEGRAM_LIVE=1 stores new messages of the trusted channels as they arrive
+TELEGRAM_LIVE = os.getenv("TELEGRAM_LIVE", "0").lower() in ("1", "true", "yes")
+
+
 # --- Lifespan Management for DB Initialization ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -20,7 +30,19 @@ async def lifespan(app: FastAPI):
     # Initialize AraBERT-based vector store (SQLite persistence)
     init_vector_store()
     print("Vector store initialized (AraBERT embeddings).")
+    if TELEGRAM_LIVE:
+        try:
+            # Live batches go through the single ingestion writer too
+            get_telegram_service().start_live(
+                sink=lambda batch: get_ingest_queue().submit_articles("telegram-live", batch)
+            )
+        except Exception as e:
+            print(f"Live Telegram ingestion not started: {e}")
     yield
+    get_inference_executor().shutdown()
+    shutdown_telegram_service()
+    shutdown_ingest_queue()
+    close_vector_store()
     print("Server shutting down.")
 
 # --- API Setup ---
@@ -34,47 +56,39 @@ app = FastAPI(
 class QueryRequest(BaseModel):
     query_text: str
 
-# --- API Endpoints ---
 
-@app.get("/health")
-async def health():
-    return {"status": "ok"}
+class BatchRequest(BaseModel):
+    claims: List[str]
+    stream: bool = False  # NDJSON, one result per line in input order
 
-@app.post("/verify")
-async def verify_news(request: QueryRequest):
-    """Receives a news query, verifies it, and returns the verdict with an explanation."""
-    query = request.query_text
-    if not query:
-        raise HTTPException(status_code=400, detail="Query text cannot be empty.")
 
-    print(f"\nReceived query for verification: '{query}'")
-    
-    # --- Early filtering for short, casual messages ---
-    word_count = len(query.strip().split())
-    casual_keywords = ["مرحبا", "مرحباً", "اهلا", "أهلا", "هلا", "السلام", "صباح", "مساء", "شكرا", "شكراً", "تحية"]
-    
-    if word_count <= 4 and any(keyword in query for keyword in casual_keywords):
-        # Return a simple, direct response without searching the database
-        print("Short casual message detected. Skipping AraBERT search.")
-        casual_response = "مرحباً! هذا النظام مخصص للتحقق من الأخبار والإجابة على أسئلة حول الأحداث في العراق. الرجاء إدخال خبر أو سؤال للتحقق منه."
-        return {"verdict": casual_response, "source": None, "status": "casual"}
-    
-    # --- Normal verification flow ---
-    contexts, is_relevant, best_sim = search(query, top_k=8)
+# Largest number of claims accepted by /verify/batch
+VERIFY_BATCH_MAX = int(os.getenv("VERIFY_BATCH_MAX", "500"))
 
-    print(f"Top contexts found: {[ (c.get('title'), c.get('similarity')) for c in contexts[:3] ]}")
-    
-    # Generate a response whether context was found or not
-    print("Generating response from LLM...")
-    verdict, is_question = generate_response(user_query=query, retrieved_context=contexts, is_relevant=is_relevant)
 
-    # Determine status based on verdict content with strict rules
+@app.exception_handler(InferenceSaturated)
+async def inference_saturated_handler(request, exc: InferenceSaturated):
+    # Shed load instead of queueing: clients retry, cheap endpoints stay fast
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry shortly."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+# --- Verdict post-processing shared by /verify and /verify/stream ---
+
+CASUAL_KEYWORDS = ["مرحبا", "مرحباً", "اهلا", "أهلا", "هلا", "السلام", "صباح", "مساء", "شكرا", "شكراً", "تحية"]
+CASUAL_RESPONSE = "مرحباً! هذا النظام مخصص للتحقق من الأخبار والإجابة على أسئلة حول الأحداث في العراق. الرجاء إدخال خبر أو سؤال للتحقق منه."
+
+
+def is_casual(query: str) -> bool:
+    """Short greetings are answered directly without searching the database."""
+    return len(query.strip().split()) <= 4 and any(keyword in query for keyword in CASUAL_KEYWORDS)
+
+
+def determine_status(verdict: str, is_question: bool, is_relevant: bool, best_sim: float) -> str:
+    """Status from the LLM verdict and retrieval confidence, with strict rules."""
     status = "unverified"  # Default
-    
-    print(f"Verdict from LLM: {verdict[:150]}...")  # Log first 150 chars
-    print(f"is_relevant: {is_relevant}, is_question: {is_question}, best_sim: {best_sim:.3f}")
-    
-    # --- Status Determination Logic ---
     if is_question:
         # For questions, the concept of verification doesn't apply.
         status = "answered"
@@ -111,145 +125,309 @@ async def verify_news(request: QueryRequest):
         print("✗ Status path: UNVERIFIED (no relevant context)")
 
     print(f"==> Final status: {status.upper()}")
-    
-    source_info = None
+    return status
+
+
+def humanize_source(u: str) -> str:
+    if not u:
+        return "مصدر خارجي"
+    if "t.me" in u:
+        parts = u.split("/")
+        # Expect: https://t.me/<username>/<id> or https://t.me/c/<id>/<post>
+        if len(parts) > 3 and parts[3] and parts[3] != "c":
+            return f"قناة @{parts[3]}"
+        return "قناة تليجرام"
+    domain = urlparse(u).netloc.lower().replace("www.", "")
+    mapping = {
+        "moe.gov.iq": "موقع وزارة التربية",
+        "moedu.gov.iq": "موقع وزارة التربية",
+        "mohesr.gov.iq": "موقع وزارة التعليم العالي",
+        "moi.gov.iq": "موقع وزارة الداخلية",
+        "mod.mil.iq": "موقع وزارة الدفاع",
+        "oil.gov.iq": "موقع وزارة النفط",
+        "pmo.iq": "موقع رئاسة الوزراء",
+        "facebook.com": "فيسبوك",
+        "x.com": "تويتر",
+        "twitter.com": "تويتر",
+        "instagram.com": "إنستغرام",
+        "youtube.com": "يوتيوب",
+    }
+    for key, label in mapping.items():
+        if key in domain:
+            return label
+    return f"موقع {domain}" if domain else "مصدر خارجي"
+
+
+def build_source_info(status: str, contexts: list) -> dict | None:
+    """Human-friendly label for the top source of a verified/answered claim."""
     if status in ("verified", "answered") and contexts:
-        # Build a human-friendly source label
         url = contexts[0].get("url", "")
+        return {"url": url, "label": humanize_source(url)}
+    return None
 
-        def humanize_source(u: str) -> str:
-            if not u:
-                return "مصدر خارجي"
-            if "t.me" in u:
-                parts = u.split("/")
-                # Expect: https://t.me/<username>/<id> or https://t.me/c/<id>/<post>
-                if len(parts) > 3 and parts[3] and parts[3] != "c":
-                    return f"قناة @{parts[3]}"
-                return "قناة تليجرام"
-            domain = urlparse(u).netloc.lower().replace("www.", "")
-            mapping = {
-                "moe.gov.iq": "موقع وزارة التربية",
-                "moedu.gov.iq": "موقع وزارة التربية",
-                "mohesr.gov.iq": "موقع وزارة التعليم العالي",
-                "moi.gov.iq": "موقع وزارة الداخلية",
-                "mod.mil.iq": "موقع وزارة الدفاع",
-                "oil.gov.iq": "موقع وزارة النفط",
-                "pmo.iq": "موقع رئاسة الوزراء",
-                "facebook.com": "فيسبوك",
-                "x.com": "تويتر",
-                "twitter.com": "تويتر",
-                "instagram.com": "إنستغرام",
-                "youtube.com": "يوتيوب",
-            }
-            for key, label in mapping.items():
-                if key in domain:
-                    return label
-            return f"موقع {domain}" if domain else "مصدر خارجي"
-
-        source_label = humanize_source(url)
-        source_info = {"url": url, "label": source_label}
-
-    # --- Normalize verdict text to avoid contradictions with status ---
-    def normalize_verdict(status_val: str, raw_text: str) -> str:
-        try:
-            negative_markers = [
-                "لا توجد معلومات",
-                "لا تتضمن النصوص",
-                "لا يمكن التأكد",
-                "لم أجد",
-                "لا يوجد",
-                "غير مؤكد",
-            ]
-            if status_val == "verified":
-                # Compose a deterministic, concise confirmation
-                src_label = source_info.get("label") if source_info else "المصادر"
-                src_url = source_info.get("url") if source_info else ""
-                line1 = "✅ الخبر موثوق"
-                line2 = f"تم التحقق من الخبر بمقارنته مع المحتوى الموجود في قاعدة البيانات من {src_label}، باستخدام تقنية الاسترجاع المعزز بالذكاء الاصطناعي (RAG)."
-                line3 = f"المصدر: {src_url}" if src_url else ""
-                return "\n".join([l for l in [line1, line2, line3] if l])
-            elif status_val == "unverified":
-                # Ensure header exists and keep the LLM explanation
-                header = "⚠️ الخبر غير مؤكد"
-                body = raw_text or ""
-                if not (body.strip().startswith("⚠️") or "الخبر غير مؤكد" in body[:40]):
-                    body = header + "\n" + body
-                return body.strip()
-            else:
-                # answered/casual -> keep as is
-                return raw_text
-        except Exception:
+
+# --- Normalize verdict text to avoid contradictions with status ---
+def normalize_verdict(status_val: str, raw_text: str, source_info: dict | None) -> str:
+    try:
+        negative_markers = [
+            "لا توجد معلومات",
+            "لا تتضمن النصوص",
+            "لا يمكن التأكد",
+            "لم أجد",
+            "لا يوجد",
+            "غير مؤكد",
+        ]
+        if status_val == "verified":
+            # Compose a deterministic, concise confirmation
+            src_label = source_info.get("label") if source_info else "المصادر"
+            src_url = source_info.get("url") if source_info else ""
+            line1 = "✅ الخبر موثوق"
+            line2 = f"تم التحقق من الخبر بمقارنته مع المحتوى الموجود في قاعدة البيانات من {src_label}، باستخدام تقنية الاسترجاع المعزز بالذكاء الاصطناعي (RAG)."
+            line3 = f"المصدر: {src_url}" if src_url else ""
+            return "\n".join([l for l in [line1, line2, line3] if l])
+        elif status_val == "unverified":
+            # Ensure header exists and keep the LLM explanation
+            header = "⚠️ الخبر غير مؤكد"
+            body = raw_text or ""
+            if not (body.strip().startswith("⚠️") or "الخبر غير مؤكد" in body[:40]):
+                body = header + "\n" + body
+            return body.strip()
+        else:
+            # answered/casual -> keep as is
             return raw_text
+    except Exception:
+        return raw_text
+
+
+# --- API Endpoints ---
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "inference": get_inference_executor().stats()}
 
-    final_verdict = normalize_verdict(status, verdict)
+@app.get("/cache-stats")
+async def get_cache_stats():
+    """Hit/miss counters of the query embedding, search result and verdict caches."""
+    return {**cache_stats(), **verdict_cache_stats()}
+
+@app.get("/telegram-stats")
+async def get_telegram_stats():
+    """Per-channel outcome of the last Telegram sync and live ingestion counters."""
+    return telegram_stats()
+
+@app.post("/verify")
+async def verify_news(request: QueryRequest):
+    """Receives a news query, verifies it, and returns the verdict with an explanation."""
+    query = request.query_text
+    if not query:
+        raise HTTPException(status_code=400, detail="Query text cannot be empty.")
+
+    print(f"\nReceived query for verification: '{query}'")
+    
+    # --- Early filtering for short, casual messages ---
+    if is_casual(query):
+        # Return a simple, direct response without searching the database
+        print("Short casual message detected. Skipping AraBERT search.")
+        return {"verdict": CASUAL_RESPONSE, "source": None, "status": "casual"}
+    
+    # --- Normal verification flow ---
+    # Embedding + scoring run on the inference pool, never on the event loop
+    contexts, is_relevant, best_sim = await get_inference_executor().run(search, query, top_k=8)
+
+    print(f"Top contexts found: {[ (c.get('title'), c.get('similarity')) for c in contexts[:3] ]}")
+    
+    # Generate a response whether context was found or not
+    print("Generating response from LLM...")
+    verdict, is_question = await cached_agenerate_response(user_query=query, retrieved_context=contexts, is_relevant=is_relevant)
+
+    print(f"Verdict from LLM: {verdict[:150]}...")  # Log first 150 chars
+    print(f"is_relevant: {is_relevant}, is_question: {is_question}, best_sim: {best_sim:.3f}")
+
+    status = determine_status(verdict, is_question, is_relevant, best_sim)
+    source_info = build_source_info(status, contexts)
+    final_verdict = normalize_verdict(status, verdict, source_info)
     
     # The LLM now provides the full response text
     return {"verdict": final_verdict, "source": source_info, "status": status}
 
-def run_telegram_and_populate():
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/verify/stream")
+async def verify_news_stream(request: QueryRequest):
+    """Server-sent events version of /verify: a `sources` event right after
+    retrieval, `token` events as the verdict is generated, and a final `done`
+    event with the same verdict/source/status payload as /verify.
     """
-    A synchronous wrapper that runs the async get_telegram_messages function
-    and then populates the database.
+    query = request.query_text
+    if not query:
+        raise HTTPException(status_code=400, detail="Query text cannot be empty.")
+
+    print(f"\nReceived query for streaming verification: '{query}'")
+
+    if is_casual(query):
+        async def casual():
+            yield _sse("done", {"verdict": CASUAL_RESPONSE, "source": None, "status": "casual"})
+        return StreamingResponse(casual(), media_type="text/event-stream")
+
+    # Retrieval (and the verdict cache lookup) happen before the response
+    # starts, so a saturated inference pool can still answer 503
+    contexts, is_relevant, best_sim = await get_inference_executor().run(search, query, top_k=8)
+    chunks, is_question = await cached_astream_response(query, contexts, is_relevant)
+
+    async def events():
+        yield _sse("sources", [
+            {"title": c.get("title"), "url": c.get("url"), "similarity": c.get("similarity")}
+            for c in contexts
+        ])
+
+        parts = []
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield _sse("token", {"text": chunk})
+        verdict = "".join(parts).strip()
+
+        status = determine_status(verdict, is_question, is_relevant, best_sim)
+        source_info = build_source_info(status, contexts)
+        yield _sse("done", {
+            "verdict": normalize_verdict(status, verdict, source_info),
+            "source": source_info,
+            "status": status,
+        })
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/verify/batch")
+async def verify_batch(request: BatchRequest):
+    """Verify many claims in one request. Identical claims are verified once,
+    all claims are embedded and searched in one batched pass, and LLM calls
+    run with bounded concurrency. Results come back in input order, as a JSON
+    list or, with `stream`, as NDJSON lines as soon as each is ready.
     """
-    print("\n--- Starting background Telegram fetch and population process ---")
-    
-    try:
-        # Create a new event loop for this thread
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+    claims = request.claims
+    if not claims:
+        raise HTTPException(status_code=400, detail="Claims list cannot be empty.")
+    if len(claims) > VERIFY_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {VERIFY_BATCH_MAX} claims per batch.")
+
+    keys = [" ".join(c.split()) for c in claims]
+    unique = [k for k in dict.fromkeys(keys) if k and not is_casual(k)]
+    print(f"\nReceived batch of {len(claims)} claims ({len(unique)} unique to verify)")
 
-        # Run the async function and get the results - per user request fetch 50 per channel
-        articles = loop.run_until_complete(get_telegram_messages(limit_per_channel=10))
+    searches = dict(zip(unique, await get_inference_executor().run(search_many, unique, top_k=8)))
+    # Keeps a large batch from flooding the inference pool and the LLMs
+    slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
 
-        if not articles:
-            print("Telegram fetch process finished, but no articles were found.")
-            return
+    async def verify_one(claim: str) -> dict:
+        contexts, is_relevant, best_sim = searches[claim]
+        async with slots:
+            try:
+                verdict, is_question = await cached_agenerate_response(claim, contexts, is_relevant)
+            except Exception as e:
+                print(f"⚠ Batch claim failed: {e}")
+                return {"verdict": None, "source": None, "status": "error", "error": str(e)}
+        status = determine_status(verdict, is_question, is_relevant, best_sim)
+        source_info = build_source_info(status, contexts)
+        return {"verdict": normalize_verdict(status, verdict, source_info), "source": source_info, "status": status}
 
-        print(f"Total articles fetched from Telegram: {len(articles)}")
-        upsert_articles(articles)
-        print("--- Background Telegram fetch and population process finished ---")
+    tasks = {claim: asyncio.ensure_future(verify_one(claim)) for claim in unique}
 
-    except Exception as e:
-        print(f"An error occurred during the Telegram process: {e}")
-    finally:
-        # Clean up the event loop
-        if 'loop' in locals():
-            loop.close()
+    async def result(i: int) -> dict:
+        if not keys[i]:
+            body = {"verdict": "الرجاء إدخال نص للتحقق منه.", "source": None, "status": "unverified"}
+        elif is_casual(keys[i]):
+            body = {"verdict": CASUAL_RESPONSE, "source": None, "status": "casual"}
+        else:
+            body = await tasks[keys[i]]
+        return {"index": i, "claim": claims[i], **body}
 
+    if not request.stream:
+        return {"results": [await result(i) for i in range(len(claims))]}
 
-@app.post("/populate-from-telegram")
-async def populate_from_telegram_endpoint():
+    async def lines():
+        try:
+            for i in range(len(claims)):
+                yield json.dumps(await result(i), ensure_ascii=False) + "\n"
+        finally:
+            # Client went away: stop generating the remaining verdicts
+            for task in tasks.values():
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def run_telegram_and_populate(job):
     """
-    Triggers a background task to fetch messages from Telegram and populate the database.
+    Ingestion job: fetches from Telegram over the shared TelegramService
+    connection and then populates the database.
     """
-    print("Received request to populate from Telegram. Starting in background.")
-    # Run the synchronous wrapper in a separate thread
-    thread = threading.Thread(target=run_telegram_and_populate)
-    thread.start()
-    
-    return {"message": "Telegram fetch and population process started in the background. This may take several minutes. Please check the terminal for login prompts if this is the first run."}
+    # Reuses the process-wide client: no new loop, login or entity lookups
+    articles = get_telegram_service().fetch(limit_per_channel=10)
+    job.fetched = len(articles)
+    if not articles:
+        print("Telegram fetch process finished, but no articles were found.")
+        return
+    print(f"Total articles fetched from Telegram: {len(articles)}")
+    job.store(articles)
+
 
+def run_external_news_and_populate(job):
+    articles = fetch_all_external(limit_each=50)
+    job.fetched = len(articles)
+    if not articles:
+        print("External news fetch finished, but no articles were found.")
+        return
+    print(f"Total external articles fetched: {len(articles)}")
+    job.store(articles)
 
-def run_external_news_and_populate():
-    print("\n--- Starting background External News fetch and population process ---")
+
+def submit_ingest_job(kind: str, fn) -> dict:
+    """Queue an ingestion job; a repeat request while the same kind of job is
+    still waiting gets that job back instead of a second one.
+    """
     try:
-        articles = fetch_all_external(limit_each=50)
-        if not articles:
-            print("External news fetch finished, but no articles were found.")
-            return
-        print(f"Total external articles fetched: {len(articles)}")
-        upsert_articles(articles)
-        print("--- Background External News fetch and population process finished ---")
-    except Exception as e:
-        print(f"An error occurred during external news process: {e}")
+        job, deduplicated = get_ingest_queue().submit(kind, fn, key=kind)
+    except IngestQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return {"job_id": job.id, "status": job.status, "deduplicated": deduplicated}
+
+
+@app.post("/populate-from-telegram")
+async def populate_from_telegram_endpoint():
+    """
+    Queues a job to fetch messages from Telegram and populate the database.
+    Poll /jobs/{job_id} for progress.
+    """
+    print("Received request to populate from Telegram. Queueing ingestion job.")
+    return {
+        **submit_ingest_job("telegram", run_telegram_and_populate),
+        "message": "Telegram fetch and population job queued. This may take several minutes. Please check the terminal for login prompts if this is the first run.",
+    }
 
 
 @app.post("/populate-from-news")
 async def populate_from_news_endpoint():
-    print("Received request to populate from external news. Starting in background.")
-    thread = threading.Thread(target=run_external_news_and_populate)
-    thread.start()
-    return {"message": "External news fetch and population process started in the background."}
+    print("Received request to populate from external news. Queueing ingestion job.")
+    return {
+        **submit_ingest_job("news", run_external_news_and_populate),
+        "message": "External news fetch and population job queued.",
+    }
+
+
+@app.get("/jobs")
+async def list_jobs():
+    """Queued, running and recently finished ingestion jobs, newest first."""
+    return {"jobs": get_ingest_queue().jobs()}
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = get_ingest_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    return job.to_dict()
 
 # --- Main Execution ---
 if __name__ == "__main__":
@@ -31,12 +31,11 @@ with st.sidebar:
     if st.button("جلب من تليجرام"):
         with st.spinner("جاري جلب الأخبار من تيليجرام..."):
             try:
-                import asyncio
-                from telegram_reader import get_telegram_messages
+                from telegram_reader import get_telegram_service
                 from vector_store import upsert_articles
                 
-                # Run async function
-                articles = asyncio.run(get_telegram_messages(limit_per_channel=10))
+                # Shared connection: logs in once per process, keeps resolved channels
+                articles = get_telegram_service().fetch(limit_per_channel=10)
                 
                 if articles:
                     # Store in vector database
@@ -92,51 +91,80 @@ with st.container(border=True):
     
     verify_button = st.button("تحقق الآن (Verify Now)", type="primary")
 
+# --- Result rendering ---
+def render_status(status, source_info):
+    """Status banner and source link for a verification result"""
+    # Use the status field returned from RAG
+    if status == "verified":
+        st.success("#### ✅ الخبر موثوق")
+        if isinstance(source_info, dict) and source_info.get("url"):
+            label = source_info.get("label", "المصدر")
+            url = source_info.get("url")
+            st.markdown(f"**المصدر:** [{label}]({url})")
+    elif status == "answered":
+        st.info("#### 📖 إجابة السؤال")
+        if isinstance(source_info, dict) and source_info.get("url"):
+            label = source_info.get("label", "المصدر")
+            url = source_info.get("url")
+            st.markdown(f"**المصدر الأقرب:** [{label}]({url})")
+    elif status == "casual":
+        st.info("#### 💬 رسالة عابرة")
+    else:
+        st.error("#### ⚠️ الخبر غير مؤكد")
+
+
+def clean_verdict(verdict):
+    """Remove the redundant first line with emoji from verdict for cleaner UI"""
+    verdict_lines = verdict.split('\n')
+    if verdict_lines and ('✅' in verdict_lines[0] or '⚠️' in verdict_lines[0] or '📖' in verdict_lines[0]):
+        return '\n'.join(verdict_lines[1:]).strip()
+    return verdict
+
+
+def verdict_tokens(events, final):
+    """Feed verdict chunks to st.write_stream and keep the final result"""
+    for event, payload in events:
+        if event == "token":
+            yield payload
+        elif event == "result":
+            final.update(payload)
+
+
 # Verification Logic
 if verify_button:
     if not query_text.strip():
         st.warning("الرجاء إدخال نص للتحقق منه.")
     else:
-        with st.spinner("...جاري التحقق من الخبر"):
-            try:
-                # Call RAG pipeline directly (no API needed)
-                result = rag.verify_news(query_text)
-                
-                verdict = result.get("verdict", "")
-                source_info = result.get("source")
-                status = result.get("status", "unverified")
-
-                # Display results in a new container
-                with st.container(border=True):
-                    # Use the status field returned from RAG
-                    if status == "verified":
-                        st.success("#### ✅ الخبر موثوق")
-                        if isinstance(source_info, dict) and source_info.get("url"):
-                            label = source_info.get("label", "المصدر")
-                            url = source_info.get("url")
-                            st.markdown(f"**المصدر:** [{label}]({url})")
-                    elif status == "answered":
-                        st.info("#### 📖 إجابة السؤال")
-                        if isinstance(source_info, dict) and source_info.get("url"):
-                            label = source_info.get("label", "المصدر")
-                            url = source_info.get("url")
-                            st.markdown(f"**المصدر الأقرب:** [{label}]({url})")
-                    elif status == "casual":
-                        st.info("#### 💬 رسالة عابرة")
-                    else:
-                        st.error("#### ⚠️ الخبر غير مؤكد")
-                    
-                    # Show details directly, but remove the first line if it contains emoji
-                    st.markdown("---")
-                    # Remove the redundant first line with emoji from verdict for cleaner UI
-                    verdict_lines = verdict.split('\n')
-                    if verdict_lines and ('✅' in verdict_lines[0] or '⚠️' in verdict_lines[0] or '📖' in verdict_lines[0]):
-                        verdict_clean = '\n'.join(verdict_lines[1:]).strip()
-                    else:
-                        verdict_clean = verdict
-                    
-                    if verdict_clean:
-                        st.write(verdict_clean)
+        try:
+            # Call RAG pipeline directly (no API needed); only retrieval
+            # runs under the spinner, the verdict streams in as it is generated
+            events = rag.verify_news_stream(query_text)
+            with st.spinner("...جاري التحقق من الخبر"):
+                event, payload = next(events)
 
-            except Exception as e:
-                st.error(f"حدث خطأ غير متوقع: {e}")
+            # Display results in a new container
+            with st.container(border=True):
+                header = st.container()
+                st.markdown("---")
+                body = st.empty()
+
+                result = {}
+                if event == "result":
+                    result = payload
+                else:
+                    with body.container():
+                        st.caption(f"تم العثور على {len(payload)} مصدر، جاري توليد الحكم...")
+                        st.write_stream(verdict_tokens(events, result))
+
+                with header:
+                    render_status(result.get("status", "unverified"), result.get("source"))
+
+                # Show details directly (replacing the raw stream)
+                verdict_clean = clean_verdict(result.get("verdict", ""))
+                if verdict_clean:
+                    body.write(verdict_clean)
+                else:
+                    body.empty()
+
+        except Exception as e:
+            st.error(f"حدث خطأ غير متوقع: {e}")
@@ -0,0 +1,89 @@
+"""
+Bounded executor for CPU-bound inference (AraBERT forward passes, vector
+scoring) so the API event loop never runs it inline.
+
+A thread pool is enough here: PyTorch and numpy release the GIL in their
+kernels, and threads share one copy of the model. Admission is bounded: once
+INFERENCE_WORKERS jobs are running and INFERENCE_QUEUE_DEPTH more are waiting,
+new work is rejected with InferenceSaturated (the API answers 503 with
+Retry-After) instead of piling up latency for everyone.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(os.cpu_count() or 2)))
+INFERENCE_QUEUE_DEPTH = int(os.getenv("INFERENCE_QUEUE_DEPTH", "32"))
+INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", "2"))
+
+
+class InferenceSaturated(RuntimeError):
+    """Raised when the executor's queue is full."""
+
+    def __init__(self, retry_after: int = INFERENCE_RETRY_AFTER):
+        super().__init__(f"inference queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    def __init__(self, workers: int = INFERENCE_WORKERS, queue_depth: int = INFERENCE_QUEUE_DEPTH):
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, queue_depth)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _admit(self):
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise InferenceSaturated()
+            self._pending += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool and await its result; raises
+        InferenceSaturated right away when the queue is full.
+        """
+        self._admit()
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        # Release on completion, not on await: a cancelled request must not
+        # free a slot while its job is still occupying a worker.
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "pending": self._pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_executor: InferenceExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_inference_executor() -> InferenceExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = InferenceExecutor()
+        return _executor
@@ -0,0 +1,190 @@
+"""
+Single-writer ingestion job queue.
+
+Every write to the vector store from the API (populate endpoints, live
+Telegram batches) runs as a job on one writer thread, so ingestion is
+serialized against the shared SQLite connection and the embedding model only
+ever sees one upsert batch at a time. Jobs have ids and progress counters
+(fetched, embedded, upserted, skipped), and a request for a job identical to
+one still waiting in the queue returns that job instead of adding another.
+"""
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List
+
+from vector_store import advance_channel_marks, upsert_articles
+
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "100"))
+# Articles embedded and written per upsert call (progress granularity)
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "64"))
+# Finished jobs kept for /jobs lookups
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "200"))
+
+
+class IngestQueueFull(RuntimeError):
+    """Raised when INGEST_QUEUE_SIZE jobs are already waiting."""
+
+
+class Job:
+    """One ingestion run. `fn(job)` fetches articles and hands them to
+    job.store(), which upserts them in chunks and updates the counters.
+    """
+
+    def __init__(self, kind: str, fn: Callable, key: str | None = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.fn = fn
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.fetched = 0
+        self.embedded = 0
+        self.upserted = 0
+        self.skipped = 0
+        self.error = None
+        self.done = threading.Event()
+
+    def store(self, articles: List[Dict]):
+        """Upsert articles in INGEST_CHUNK_SIZE chunks, counting progress:
+        `embedded` moves once a chunk's new or changed articles are embedded,
+        `upserted` once they are written. Telegram sync marks advance only
+        after the last chunk, so a failed chunk is fetched again next sync.
+        """
+        for start in range(0, len(articles), INGEST_CHUNK_SIZE):
+            stats = upsert_articles(
+                articles[start:start + INGEST_CHUNK_SIZE], on_embedded=self._count_embedded, advance_marks=False
+            )
+            self.upserted += stats["inserted"] + stats["updated"]
+            self.skipped += stats["skipped"]
+        advance_channel_marks(articles)
+
+    def _count_embedded(self, n: int):
+        self.embedded += n
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "fetched": self.fetched,
+            "embedded": self.embedded,
+            "upserted": self.upserted,
+            "skipped": self.skipped,
+            "error": self.error,
+        }
+
+
+class IngestQueue:
+    def __init__(self, maxsize: int = INGEST_QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._pending: Dict[str, Job] = {}  # dedup key -> queued job
+        self._thread = None
+
+    def submit(self, kind: str, fn: Callable, key: str | None = None) -> tuple[Job, bool]:
+        """Queue a job; returns (job, deduplicated). With a `key`, an identical
+        job still waiting in the queue is returned instead of a new one.
+        """
+        with self._lock:
+            if key is not None and key in self._pending:
+                return self._pending[key], True
+            job = Job(kind, fn, key)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise IngestQueueFull(f"{self._queue.maxsize} ingestion jobs already queued") from None
+            self._jobs[job.id] = job
+            if key is not None:
+                self._pending[key] = job
+            self._trim()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+                self._thread.start()
+            return job, False
+
+    def submit_articles(self, kind: str, articles: List[Dict], wait: bool = True) -> Job:
+        """Queue already-fetched articles for storage (e.g. live batches)."""
+        def fn(job):
+            job.fetched = len(articles)
+            job.store(articles)
+        job, _ = self.submit(kind, fn)
+        if wait:
+            job.done.wait()
+            if job.status == "failed":
+                raise RuntimeError(job.error)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Dict]:
+        with self._lock:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def _trim(self):
+        finished = [jid for jid, j in self._jobs.items() if j.done.is_set()]
+        for jid in finished[: max(0, len(finished) - INGEST_JOB_HISTORY)]:
+            del self._jobs[jid]
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.key is not None and self._pending.get(job.key) is job:
+                    del self._pending[job.key]
+                job.status = "running"
+                job.started = time.time()
+            print(f"--- Ingestion job {job.id} ({job.kind}) started ---")
+            try:
+                job.fn(job)
+                job.status = "done"
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                print(f"An error occurred during ingestion job {job.id} ({job.kind}): {e}")
+            finally:
+                job.finished = time.time()
+                job.done.set()
+            print(
+                f"--- Ingestion job {job.id} {job.status}: fetched {job.fetched}, embedded {job.embedded}, "
+                f"upserted {job.upserted}, skipped {job.skipped} ---"
+            )
+
+    def shutdown(self):
+        """Stop the writer after the jobs already queued."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=30)
+
+
+_ingest_queue: IngestQueue | None = None
+_ingest_lock = threading.Lock()
+
+
+def get_ingest_queue() -> IngestQueue:
+    global _ingest_queue
+    with _ingest_lock:
+        if _ingest_queue is None:
+            _ingest_queue = IngestQueue()
+        return _ingest_queue
+
+
+def shutdown_ingest_queue():
+    global _ingest_queue
+    with _ingest_lock:
+        ingest, _ingest_queue = _ingest_queue, None
+    if ingest is not None:
+        ingest.shutdown()
@@ -0,0 +1,491 @@
+"""
+Long-lived LLM client shared by every request.
+
+Gemini is configured once and model handles are cached. The client remembers
+which model answered last and tries it first, and each model sits behind a
+circuit breaker so a model that keeps failing (or 404s) is skipped for a
+backoff period instead of costing a network round trip on every request.
+
+Providers (Gemini, Ollama, and a local stub for tests) expose both a blocking
+generate() and an async agenerate(); the async path adds per-call deadlines,
+a concurrency cap and optional hedged requests. stream()/astream() yield the
+answer in chunks as the model produces it.
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+from typing import AsyncIterator, Dict, Iterator, List, Tuple
+
+import ollama
+try:
+    import google.generativeai as genai
+    print("✓ google.generativeai imported successfully")
+except Exception as e:
+    genai = None
+    print(f"⚠ Failed to import google.generativeai: {e}")
+
+# Always prioritize environment variables for API keys
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+if not GEMINI_API_KEY:
+    try:
+        from config import GEMINI_API_KEY as CONFIG_KEY
+        GEMINI_API_KEY = CONFIG_KEY
+    except Exception:
+        pass
+
+# Debug: Check if key is loaded (show only first/last 4 chars for security)
+if GEMINI_API_KEY:
+    key_preview = f"{GEMINI_API_KEY[:4]}...{GEMINI_API_KEY[-4:]}" if len(GEMINI_API_KEY) > 8 else "***"
+    print(f"✓ GEMINI_API_KEY loaded: {key_preview}")
+else:
+    print("⚠ GEMINI_API_KEY not found!")
+
+GEMINI_GENERATION_CONFIG = {
+    "temperature": 0.1,
+    "top_p": 0.8,
+    "top_k": 40,
+    "max_output_tokens": 500,
+}
+OLLAMA_OPTIONS = {"temperature": 0.1, "num_predict": 300}
+
+# Breaker backoff after consecutive failures doubles from BASE up to MAX;
+# a model the API reports as missing is parked for NOT_FOUND seconds.
+LLM_BREAKER_BASE_BACKOFF = float(os.getenv("LLM_BREAKER_BASE_BACKOFF", "30"))
+LLM_BREAKER_MAX_BACKOFF = float(os.getenv("LLM_BREAKER_MAX_BACKOFF", "900"))
+LLM_BREAKER_NOT_FOUND_BACKOFF = float(os.getenv("LLM_BREAKER_NOT_FOUND_BACKOFF", "3600"))
+
+# "auto" = Gemini then Ollama; "stub" = canned local answer (tests, load runs)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "auto").lower()
+# Deadline of a single model call, in seconds
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+# Cap on concurrent in-flight async model calls
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Fire the next model in the chain when the first has not answered after
+# this many seconds (0 disables hedging)
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0"))
+LLM_STUB_RESPONSE = os.getenv("LLM_STUB_RESPONSE", "⚠️ الخبر غير مؤكد\n(رد تجريبي من المزوّد المحلي)")
+LLM_STUB_DELAY = float(os.getenv("LLM_STUB_DELAY", "0"))
+
+
+def _normalize_gemini_model(name: str | None) -> str | None:
+    """Ensure model names include the correct API prefix."""
+    if not name:
+        return None
+    cleaned = name.strip()
+    if cleaned.startswith("models/") or cleaned.startswith("tunings/"):
+        return cleaned
+    return f"models/{cleaned}"
+
+
+class LLMUnavailable(RuntimeError):
+    """Raised by the streaming calls when no model could answer."""
+
+
+def _is_not_found(err: Exception) -> bool:
+    text = str(err).lower()
+    return "404" in text or "not found" in text
+
+
+class CircuitBreaker:
+    """Per-model breaker: closed while the model works, open (skipped) for an
+    exponentially growing backoff after each consecutive failure.
+    """
+
+    def __init__(self, base_backoff: float = LLM_BREAKER_BASE_BACKOFF, max_backoff: float = LLM_BREAKER_MAX_BACKOFF):
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.open_until = 0.0
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.open_until
+
+    def record_success(self):
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self, not_found: bool = False):
+        self.failures += 1
+        if not_found:
+            backoff = LLM_BREAKER_NOT_FOUND_BACKOFF
+        else:
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** (self.failures - 1))
+        self.open_until = time.monotonic() + backoff
+
+
+def _field(obj, name, default):
+    # Response pieces are protos (attributes) or plain dicts depending on the SDK version
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def _gemini_text(resp) -> str | None:
+    try:
+        content = resp.text
+    except (AttributeError, ValueError):
+        # .text raises ValueError when a response or stream chunk has no
+        # parts (e.g. the final or a safety-stopped chunk)
+        content = None
+    if not content and getattr(resp, "candidates", None):
+        parts = []
+        for c in resp.candidates:
+            for p in _field(_field(c, "content", None), "parts", None) or []:
+                parts.append(str(_field(p, "text", "") or ""))
+        content = "\n".join(parts)
+    return content
+
+
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self):
+        genai.configure(api_key=GEMINI_API_KEY)
+        self._handles: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _model(self, model: str):
+        with self._lock:
+            handle = self._handles.get(model)
+            if handle is None:
+                handle = self._handles[model] = genai.GenerativeModel(model)
+            return handle
+
+    def generate(self, model: str, prompt: str) -> str | None:
+        resp = self._model(model).generate_content(
+            prompt, generation_config=GEMINI_GENERATION_CONFIG, request_options={"timeout": LLM_TIMEOUT}
+        )
+        return _gemini_text(resp)
+
+    async def agenerate(self, model: str, prompt: str) -> str | None:
+        resp = await self._model(model).generate_content_async(prompt, generation_config=GEMINI_GENERATION_CONFIG)
+        return _gemini_text(resp)
+
+    def stream(self, model: str, prompt: str) -> Iterator[str]:
+        resp = self._model(model).generate_content(
+            prompt, generation_config=GEMINI_GENERATION_CONFIG, stream=True, request_options={"timeout": LLM_TIMEOUT}
+        )
+        for chunk in resp:
+            text = _gemini_text(chunk)
+            if text:
+                yield text
+
+    async def astream(self, model: str, prompt: str) -> AsyncIterator[str]:
+        resp = await self._model(model).generate_content_async(
+            prompt, generation_config=GEMINI_GENERATION_CONFIG, stream=True
+        )
+        async for chunk in resp:
+            text = _gemini_text(chunk)
+            if text:
+                yield text
+
+
+class OllamaProvider:
+    name = "ollama"
+
+    def __init__(self):
+        self._client = ollama.Client(timeout=LLM_TIMEOUT)
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def generate(self, model: str, prompt: str) -> str | None:
+        resp = self._client.chat(model=model, messages=[{"role": "user", "content": prompt}], options=OLLAMA_OPTIONS)
+        return resp["message"]["content"]
+
+    def _async_client(self):
+        # httpx async clients are bound to the loop that created them
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = ollama.AsyncClient(timeout=LLM_TIMEOUT)
+        return client
+
+    async def agenerate(self, model: str, prompt: str) -> str | None:
+        resp = await self._async_client().chat(
+            model=model, messages=[{"role": "user", "content": prompt}], options=OLLAMA_OPTIONS
+        )
+        return resp["message"]["content"]
+
+    def stream(self, model: str, prompt: str) -> Iterator[str]:
+        for part in self._client.chat(
+            model=model, messages=[{"role": "user", "content": prompt}], options=OLLAMA_OPTIONS, stream=True
+        ):
+            yield part["message"]["content"]
+
+    async def astream(self, model: str, prompt: str) -> AsyncIterator[str]:
+        parts = await self._async_client().chat(
+            model=model, messages=[{"role": "user", "content": prompt}], options=OLLAMA_OPTIONS, stream=True
+        )
+        async for part in parts:
+            yield part["message"]["content"]
+
+
+class StubProvider:
+    """Local canned answer, no network; selected with LLM_PROVIDER=stub."""
+    name = "stub"
+
+    def generate(self, model: str, prompt: str) -> str | None:
+        if LLM_STUB_DELAY:
+            time.sleep(LLM_STUB_DELAY)
+        return LLM_STUB_RESPONSE
+
+    async def agenerate(self, model: str, prompt: str) -> str | None:
+        if LLM_STUB_DELAY:
+            await asyncio.sleep(LLM_STUB_DELAY)
+        return LLM_STUB_RESPONSE
+
+    def stream(self, model: str, prompt: str) -> Iterator[str]:
+        words = LLM_STUB_RESPONSE.split(" ")
+        for i, word in enumerate(words):
+            if LLM_STUB_DELAY:
+                time.sleep(LLM_STUB_DELAY / len(words))
+            yield word if i == 0 else " " + word
+
+    async def astream(self, model: str, prompt: str) -> AsyncIterator[str]:
+        words = LLM_STUB_RESPONSE.split(" ")
+        for i, word in enumerate(words):
+            if LLM_STUB_DELAY:
+                await asyncio.sleep(LLM_STUB_DELAY / len(words))
+            yield word if i == 0 else " " + word
+
+
+class LLMClient:
+    """Ordered Gemini -> Ollama fallback chain with cached handles and breakers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.providers: Dict[str, object] = {}
+        self.chain: List[Tuple[str, str]] = []
+        self.gemini_enabled = False
+        if LLM_PROVIDER == "stub":
+            self.providers["stub"] = StubProvider()
+            self.chain.append(("stub", "stub"))
+        else:
+            self.gemini_enabled = bool(GEMINI_API_KEY and genai is not None)
+            # Use CORRECT model names for Gemini API v1beta
+            # Reference: https://ai.google.dev/gemini-api/docs/models/gemini
+            gemini_models = [
+                _normalize_gemini_model(os.getenv("GEMINI_MODEL")),
+                "models/gemini-1.5-flash",
+                "models/gemini-1.5-flash-latest",
+                "models/gemini-1.5-pro",
+                "models/gemini-pro",
+            ]
+            ollama_models = [
+                os.getenv("OLLAMA_MODEL") or "deepseek-v3.1:671b-cloud",
+                "gpt-oss:120b-cloud",
+                "llama3.2:1b",
+                "phi3:mini",
+            ]
+            if self.gemini_enabled:
+                self.providers["gemini"] = GeminiProvider()
+                self.chain += [("gemini", m) for m in dict.fromkeys(m for m in gemini_models if m)]
+            self.providers["ollama"] = OllamaProvider()
+            self.chain += [("ollama", m) for m in dict.fromkeys(ollama_models)]
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {c: CircuitBreaker() for c in self.chain}
+        self._preferred: Tuple[str, str] | None = None
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def signature(self) -> str:
+        """Identify the LLMs that would answer (used in cache keys)."""
+        if LLM_PROVIDER == "stub":
+            return "stub"
+        gemini = next((m for p, m in self.chain if p == "gemini"), "off")
+        ollama_model = next(m for p, m in self.chain if p == "ollama")
+        return f"gemini={gemini};ollama={ollama_model}"
+
+    def candidates(self) -> List[Tuple[str, str]]:
+        """Models to try, last successful first, skipping open breakers. If
+        every breaker is open the full chain is returned so a request still
+        gets a chance.
+        """
+        with self._lock:
+            order = list(self.chain)
+            if self._preferred in order:
+                order.remove(self._preferred)
+                order.insert(0, self._preferred)
+            live = [c for c in order if self._breakers[c].available()]
+        return live or order
+
+    def record(self, candidate: Tuple[str, str], ok: bool, err: Exception | None = None):
+        with self._lock:
+            breaker = self._breakers[candidate]
+            if ok:
+                breaker.record_success()
+                self._preferred = candidate
+            else:
+                breaker.record_failure(not_found=err is not None and _is_not_found(err))
+
+    def _failed(self, candidate: Tuple[str, str], err: Exception, errors: List[str]):
+        provider, model = candidate
+        err_msg = f"{model}: {str(err)[:150] or type(err).__name__}"
+        print(f"⚠ {provider} model failed: {err_msg}")
+        errors.append(err_msg)
+        self.record(candidate, ok=False, err=err)
+
+    def _result(self, errors: List[str]) -> Tuple[None, str]:
+        if LLM_PROVIDER != "stub" and not self.gemini_enabled:
+            errors.insert(0, "Gemini API key not configured")
+        return None, "All LLM models failed:\n" + "\n".join(f"  - {e}" for e in errors[-3:])
+
+    @staticmethod
+    def _check(model: str, content: str | None) -> str:
+        if not content or not content.strip():
+            raise ValueError(f"Empty response from {model}")
+        return content.strip()
+
+    def generate(self, prompt: str) -> Tuple[str | None, str | None]:
+        """Try the candidates in order; returns (content, None) on success or
+        (None, description of the last errors).
+        """
+        errors = []
+        for candidate in self.candidates():
+            provider, model = candidate
+            try:
+                print(f"🔄 Trying {provider} model: {model}")
+                content = self._check(model, self.providers[provider].generate(model, prompt))
+            except Exception as e:
+                self._failed(candidate, e, errors)
+                continue
+            self.record(candidate, ok=True)
+            print(f"✓ Response generated via {provider} ({model})")
+            return content, None
+        return self._result(errors)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        sem = self._semaphores.get(loop)
+        if sem is None:
+            sem = self._semaphores[loop] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        return sem
+
+    async def _acall(self, candidate: Tuple[str, str], prompt: str) -> str:
+        provider, model = candidate
+        async with self._semaphore():
+            print(f"🔄 Trying {provider} model: {model}")
+            try:
+                content = await asyncio.wait_for(self.providers[provider].agenerate(model, prompt), LLM_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"no answer within {LLM_TIMEOUT:g}s") from None
+        return self._check(model, content)
+
+    async def agenerate(self, prompt: str) -> Tuple[str | None, str | None]:
+        """Async generate(): each call has an LLM_TIMEOUT deadline and holds
+        one of LLM_MAX_CONCURRENCY slots. With LLM_HEDGE_AFTER set, the next
+        candidate is started when the current one is slow, and whichever
+        answers first wins.
+        """
+        errors = []
+        queue = self.candidates()
+        while queue:
+            candidate = queue.pop(0)
+            tasks = {asyncio.ensure_future(self._acall(candidate, prompt)): candidate}
+            hedged = False
+            try:
+                while tasks:
+                    hedge = not hedged and queue and LLM_HEDGE_AFTER > 0
+                    done, _ = await asyncio.wait(
+                        tasks, timeout=LLM_HEDGE_AFTER if hedge else None, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if not done:
+                        print(f"⏱ No answer after {LLM_HEDGE_AFTER:g}s, hedging with {queue[0][1]}")
+                        candidate = queue.pop(0)
+                        tasks[asyncio.ensure_future(self._acall(candidate, prompt))] = candidate
+                        hedged = True
+                        continue
+                    for task in done:
+                        candidate = tasks.pop(task)
+                        try:
+                            content = task.result()
+                        except Exception as e:
+                            self._failed(candidate, e, errors)
+                            continue
+                        self.record(candidate, ok=True)
+                        print(f"✓ Response generated via {candidate[0]} ({candidate[1]})")
+                        return content, None
+            finally:
+                for task in tasks:
+                    task.cancel()
+        return self._result(errors)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Yield the answer in chunks. Falls back to the next model only until
+        the first chunk arrives; raises LLMUnavailable when nothing answered
+        or the answering model broke off mid-stream.
+        """
+        errors = []
+        for candidate in self.candidates():
+            provider, model = candidate
+            started = False
+            try:
+                print(f"🔄 Streaming from {provider} model: {model}")
+                for chunk in self.providers[provider].stream(model, prompt):
+                    if chunk:
+                        started = True
+                        yield chunk
+                if not started:
+                    raise ValueError(f"Empty response from {model}")
+            except Exception as e:
+                self._failed(candidate, e, errors)
+                if started:
+                    raise LLMUnavailable(self._result(errors)[1]) from e
+                continue
+            self.record(candidate, ok=True)
+            return
+        raise LLMUnavailable(self._result(errors)[1])
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Async stream(): LLM_TIMEOUT bounds the wait for each chunk, and the
+        call holds a concurrency slot while it streams. Not hedged.
+        """
+        errors = []
+        for candidate in self.candidates():
+            provider, model = candidate
+            started = False
+            async with self._semaphore():
+                print(f"🔄 Streaming from {provider} model: {model}")
+                chunks = self.providers[provider].astream(model, prompt)
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), LLM_TIMEOUT)
+                        except StopAsyncIteration:
+                            break
+                        except asyncio.TimeoutError:
+                            raise TimeoutError(f"no chunk within {LLM_TIMEOUT:g}s") from None
+                        if chunk:
+                            started = True
+                            yield chunk
+                    if not started:
+                        raise ValueError(f"Empty response from {model}")
+                except Exception as e:
+                    self._failed(candidate, e, errors)
+                    if started:
+                        raise LLMUnavailable(self._result(errors)[1]) from e
+                    continue
+                finally:
+                    await chunks.aclose()
+            self.record(candidate, ok=True)
+            return
+        raise LLMUnavailable(self._result(errors)[1])
+
+    def breaker_states(self) -> Dict[str, Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                f"{p}:{m}": {"failures": b.failures, "open_for": max(0.0, round(b.open_until - now, 1))}
+                for (p, m), b in self._breakers.items()
+            }
+
+
+_client: LLMClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+        return _client
@@ -1,39 +1,21 @@
-import os
-from typing import List, Dict
-
-import ollama
-try:
-    import google.generativeai as genai
-    print("✓ google.generativeai imported successfully")
-except Exception as e:
-    genai = None
-    print(f"⚠ Failed to import google.generativeai: {e}")
-
-# Always prioritize environment variables for API keys
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    try:
-        from config import GEMINI_API_KEY as CONFIG_KEY
-        GEMINI_API_KEY = CONFIG_KEY
-    except Exception:
-        pass
-
-# Debug: Check if key is loaded (show only first/last 4 chars for security)
-if GEMINI_API_KEY:
-    key_preview = f"{GEMINI_API_KEY[:4]}...{GEMINI_API_KEY[-4:]}" if len(GEMINI_API_KEY) > 8 else "***"
-    print(f"✓ GEMINI_API_KEY loaded: {key_preview}")
-else:
-    print("⚠ GEMINI_API_KEY not found!")
-
-
-def _normalize_gemini_model(name: str | None) -> str | None:
-    """Ensure model names include the correct API prefix."""
-    if not name:
-        return None
-    cleaned = name.strip()
-    if cleaned.startswith("models/") or cleaned.startswith("tunings/"):
-        return cleaned
-    return f"models/{cleaned}"
+from typing import AsyncIterator, Dict, Iterator, List
+
+from llm_client import LLMUnavailable, get_llm_client
+
+
+# Prefix of the message returned when no LLM backend could answer
+LLM_ERROR_PREFIX = "⚠️ خطأ في النظام"
+
+
+def is_error_response(text: str) -> bool:
+    # A stream that broke off ends with the error message after partial text
+    return LLM_ERROR_PREFIX in text
+
+
+def model_signature() -> str:
+    """Identify the LLMs that would answer right now (used in cache keys)."""
+    return get_llm_client().signature()
+
 
 def build_context_block(retrieved_context: List[Dict]) -> str:
     blocks = []
@@ -44,15 +26,17 @@ def build_context_block(retrieved_context: List[Dict]) -> str:
     return "\n\n".join(blocks)
 
 
-def generate_response(user_query: str, retrieved_context: List[Dict], is_relevant: bool) -> tuple[str, bool]:
-    """
-    Generates a response using Gemini based on the user query and retrieved context.
-    Returns the response string and a boolean indicating if the query was a question.
-    """
-    # --- Intent Detection: Is the user asking a question? ---
+def detect_question(user_query: str) -> bool:
+    """Whether the user is asking a question rather than submitting a claim."""
     question_words = ["هل", "ماذا", "متى", "أين", "لماذا", "كيف", "من", "بكم", "كم"]
     # A simple check to see if any of the question words are in the query
-    is_question = any(word in user_query.strip().split() for word in question_words)
+    return any(word in user_query.strip().split() for word in question_words)
+
+
+def build_prompt(user_query: str, retrieved_context: List[Dict], is_relevant: bool) -> tuple[str, bool]:
+    """Build the LLM prompt for a claim; returns (prompt, is_question)."""
+    # --- Intent Detection: Is the user asking a question? ---
+    is_question = detect_question(user_query)
 
     # --- Prompt Engineering ---
     kb = build_context_block(retrieved_context)
@@ -103,95 +87,12 @@ def generate_response(user_query: str, retrieved_context: List[Dict], is_relevan
         4) اللغة: العربية.
         """
 
-    print(f"--- Sending prompt to LLM (Intent: {'Question' if is_question else 'Verification'}) ---")
+    return prompt, is_question
 
-    # --- LLM Invocation (Gemini Primary, Ollama fallback for local only) ---
-    last_err = None
-    
-    # 1) Try Gemini first (required for cloud deployment)
-    gemini_errors = []
-    if GEMINI_API_KEY and genai is not None:
-        try:
-            genai.configure(api_key=GEMINI_API_KEY)
-            # Use CORRECT model names for Gemini API v1beta
-            # Reference: https://ai.google.dev/gemini-api/docs/models/gemini
-            gemini_models = [
-                _normalize_gemini_model(os.getenv("GEMINI_MODEL")),
-                "models/gemini-1.5-flash",
-                "models/gemini-1.5-flash-latest",
-                "models/gemini-1.5-pro",
-                "models/gemini-pro",
-            ]
-            
-            for gemini_model in gemini_models:
-                if not gemini_model:
-                    continue
-                try:
-                    print(f"🔄 Trying Gemini model: {gemini_model}")
-                    model = genai.GenerativeModel(gemini_model)
-                    resp = model.generate_content(
-                        prompt,
-                        generation_config={
-                            "temperature": 0.1,
-                            "top_p": 0.8,
-                            "top_k": 40,
-                            "max_output_tokens": 500,
-                        }
-                    )
-                    content = getattr(resp, "text", None)
-                    if not content and getattr(resp, "candidates", None):
-                        parts = []
-                        for c in resp.candidates:
-                            for p in getattr(c, "content", {}).get("parts", []):
-                                parts.append(str(p.get("text", "")))
-                        content = "\n".join(parts)
-                    if content:
-                        print(f"✓ Response generated successfully via Gemini ({gemini_model})")
-                        return content.strip(), is_question
-                    else:
-                        err_msg = f"Empty response from {gemini_model}"
-                        print(f"⚠ {err_msg}")
-                        gemini_errors.append(err_msg)
-                except Exception as model_err:
-                    err_msg = f"{gemini_model}: {str(model_err)[:150]}"
-                    print(f"⚠ Gemini model failed: {err_msg}")
-                    gemini_errors.append(err_msg)
-                    continue
-            
-            last_err = f"All Gemini models failed:\n" + "\n".join(f"  - {e}" for e in gemini_errors[-3:])
-        except Exception as e:
-            last_err = f"Gemini configuration error: {e}"
-            print(f"⚠ Gemini failed: {e}")
-    else:
-        last_err = "Gemini API key not configured"
-        print("⚠ Gemini not available (no API key)")
-
-    # 2) Fallback to Ollama (local development only)
-    try:
-        forced = os.getenv("OLLAMA_MODEL")
-        preferred_models = [
-            forced if forced else "deepseek-v3.1:671b-cloud",
-            "gpt-oss:120b-cloud",
-            "llama3.2:1b",
-            "phi3:mini",
-        ]
-
-        for m in preferred_models:
-            try:
-                resp = ollama.chat(
-                    model=m,
-                    messages=[{"role": "user", "content": prompt}],
-                    options={"temperature": 0.1, "num_predict": 300},
-                )
-                print(f"✓ Response generated via Ollama ({m})")
-                return resp["message"]["content"], is_question
-            except Exception as e:
-                continue
-    except Exception:
-        pass
-
-    # 3) If both failed, return clear error message
-    error_msg = f"""⚠️ خطأ في النظام
+
+def llm_error_message(last_err: str | None) -> str:
+    """Arabic message shown when no LLM backend could answer."""
+    return f"""{LLM_ERROR_PREFIX}
 
 لم يتمكن النظام من الاتصال بخدمة الذكاء الاصطناعي.
 
@@ -203,5 +104,60 @@ def generate_response(user_query: str, retrieved_context: List[Dict], is_relevan
 - إذا استخدمت متغير GEMINI_MODEL، احرص أن يكون بالشكل models/اسم_الموديل (مثال: models/gemini-1.5-flash)
 
 يمكنك الحصول على مفتاح مجاني من: https://makersuite.google.com/app/apikey"""
-    
-    return error_msg, is_question
+
+
+def generate_response(user_query: str, retrieved_context: List[Dict], is_relevant: bool) -> tuple[str, bool]:
+    """
+    Generates a response using Gemini based on the user query and retrieved context.
+    Returns the response string and a boolean indicating if the query was a question.
+    """
+    prompt, is_question = build_prompt(user_query, retrieved_context, is_relevant)
+    print(f"--- Sending prompt to LLM (Intent: {'Question' if is_question else 'Verification'}) ---")
+
+    # --- LLM Invocation (Gemini primary, Ollama fallback; shared client) ---
+    content, last_err = get_llm_client().generate(prompt)
+    return (content or llm_error_message(last_err)), is_question
+
+
+async def agenerate_response(user_query: str, retrieved_context: List[Dict], is_relevant: bool) -> tuple[str, bool]:
+    """Async generate_response(): awaits the providers with deadlines and
+    optional hedging instead of blocking the event loop.
+    """
+    prompt, is_question = build_prompt(user_query, retrieved_context, is_relevant)
+    print(f"--- Sending prompt to LLM (Intent: {'Question' if is_question else 'Verification'}) ---")
+    content, last_err = await get_llm_client().agenerate(prompt)
+    return (content or llm_error_message(last_err)), is_question
+
+
+def stream_response(user_query: str, retrieved_context: List[Dict], is_relevant: bool) -> tuple[Iterator[str], bool]:
+    """Streaming generate_response(): returns (chunk iterator, is_question).
+    If no model answers, the error message is yielded as the last chunk.
+    """
+    prompt, is_question = build_prompt(user_query, retrieved_context, is_relevant)
+
+    def chunks():
+        started = False
+        try:
+            for chunk in get_llm_client().stream(prompt):
+                started = True
+                yield chunk
+        except LLMUnavailable as e:
+            yield ("\n\n" if started else "") + llm_error_message(str(e))
+
+    return chunks(), is_question
+
+
+async def astream_response(user_query: str, retrieved_context: List[Dict], is_relevant: bool) -> tuple[AsyncIterator[str], bool]:
+    """Async stream_response()."""
+    prompt, is_question = build_prompt(user_query, retrieved_context, is_relevant)
+
+    async def chunks():
+        started = False
+        try:
+            async for chunk in get_llm_client().astream(prompt):
+                started = True
+                yield chunk
+        except LLMUnavailable as e:
+            yield ("\n\n" if started else "") + llm_error_message(str(e))
+
+    return chunks(), is_question
@@ -3,10 +3,12 @@ RAG Pipeline - Simplified wrapper for Streamlit integration
 Combines vector store, RAG generation, and verification logic
 """
 from telegram_reader import get_telegram_messages
-from rag_arabert import generate_response
-from vector_store import init_vector_store, upsert_articles, search
+from verdict_cache import cached_generate_response, cached_stream_response
+from vector_store import init_vector_store, upsert_articles, search, search_many
+from llm_client import LLM_MAX_CONCURRENCY
 from news_fetchers import fetch_all_external
 from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
 import asyncio
 
 
@@ -29,8 +31,92 @@ class RAGPipeline:
         Returns:
             dict with keys: verdict, source, status
         """
+        query, early = self._screen(query_text)
+        if early is not None:
+            return early
+        
+        # --- Search vector store ---
+        contexts, is_relevant, best_sim = search(query, top_k=8)
+        print(f"[RAG] Best similarity: {best_sim:.3f}, Relevant: {is_relevant}")
+        
+        # --- Generate LLM response ---
+        print("[RAG] Generating response...")
+        verdict, is_question = cached_generate_response(
+            user_query=query,
+            retrieved_context=contexts,
+            is_relevant=is_relevant
+        )
+        return self._finalize(verdict, is_question, contexts, is_relevant, best_sim)
+    
+    def verify_news_stream(self, query_text: str):
+        """
+        Streaming variant of verify_news for progressive rendering
+        
+        Yields (event, payload) tuples: ("sources", contexts) right after
+        retrieval, ("token", text) for each verdict chunk as the LLM produces
+        it, and finally ("result", dict) with the same keys as verify_news.
+        """
+        query, early = self._screen(query_text)
+        if early is not None:
+            yield "result", early
+            return
+        
+        contexts, is_relevant, best_sim = search(query, top_k=8)
+        print(f"[RAG] Best similarity: {best_sim:.3f}, Relevant: {is_relevant}")
+        yield "sources", contexts
+        
+        print("[RAG] Streaming response...")
+        chunks, is_question = cached_stream_response(query, contexts, is_relevant)
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield "token", chunk
+        
+        yield "result", self._finalize("".join(parts).strip(), is_question, contexts, is_relevant, best_sim)
+    
+    def verify_many(self, claims: list) -> list:
+        """
+        Verify many claims at once; results are in input order
+        
+        Identical claims are verified once, all claims are embedded and
+        searched in one batched pass, and LLM calls run concurrently
+        (at most LLM_MAX_CONCURRENCY at a time).
+        """
+        return [result for _, result in self.iter_verify_many(claims)]
+    
+    def iter_verify_many(self, claims: list):
+        """Yield (index, result) for verify_many in input order, each as soon as it is ready"""
+        screened = [self._screen(claim) for claim in claims]
+        unique = {}
+        for query, early in screened:
+            if early is None:
+                unique.setdefault(_claim_key(query), query)
+        keys = list(unique)
+        print(f"[RAG] Batch of {len(claims)} claims, {len(keys)} unique to verify")
+        searches = dict(zip(keys, search_many([unique[k] for k in keys], top_k=8)))
+        
+        def verify_one(key):
+            contexts, is_relevant, best_sim = searches[key]
+            verdict, is_question = cached_generate_response(
+                user_query=unique[key],
+                retrieved_context=contexts,
+                is_relevant=is_relevant
+            )
+            return self._finalize(verdict, is_question, contexts, is_relevant, best_sim)
+        
+        pool = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY)
+        try:
+            futures = {key: pool.submit(verify_one, key) for key in keys}
+            for i, (query, early) in enumerate(screened):
+                yield i, dict(early if early is not None else futures[_claim_key(query)].result())
+        finally:
+            # Abandoned iteration must not keep generating verdicts
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    def _screen(self, query_text: str):
+        """Return (query, early_result); early_result is set for empty or casual input"""
         if not query_text or not query_text.strip():
-            return {
+            return None, {
                 "verdict": "الرجاء إدخال نص للتحقق منه.",
                 "source": None,
                 "status": "unverified"
@@ -46,20 +132,12 @@ class RAGPipeline:
         if word_count <= 4 and any(keyword in query for keyword in casual_keywords):
             print("[RAG] Short casual message detected")
             casual_response = "مرحباً! هذا النظام مخصص للتحقق من الأخبار والإجابة على أسئلة حول الأحداث في العراق. الرجاء إدخال خبر أو سؤال للتحقق منه."
-            return {"verdict": casual_response, "source": None, "status": "casual"}
-        
-        # --- Search vector store ---
-        contexts, is_relevant, best_sim = search(query, top_k=8)
-        print(f"[RAG] Best similarity: {best_sim:.3f}, Relevant: {is_relevant}")
-        
-        # --- Generate LLM response ---
-        print("[RAG] Generating response...")
-        verdict, is_question = generate_response(
-            user_query=query,
-            retrieved_context=contexts,
-            is_relevant=is_relevant
-        )
+            return query, {"verdict": casual_response, "source": None, "status": "casual"}
         
+        return query, None
+    
+    def _finalize(self, verdict: str, is_question: bool, contexts: list, is_relevant: bool, best_sim: float) -> dict:
+        """Turn the LLM verdict and retrieval scores into the final result"""
         # --- Determine status ---
         status = "unverified"  # Default
         
@@ -176,6 +254,11 @@ class RAGPipeline:
             return raw_text
 
 
+def _claim_key(query: str) -> str:
+    """Claims differing only in whitespace are the same claim"""
+    return " ".join(query.split())
+
+
 # For direct testing
 if __name__ == "__main__":
     rag = RAGPipeline()
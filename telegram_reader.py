@@ -1,7 +1,12 @@
 # telegram_reader.py
 import asyncio
+import os
+import random
+import threading
+import time
 from pathlib import Path
-from telethon import TelegramClient
+from telethon import TelegramClient, events
+from telethon.errors import FloodWaitError, ServerError
 from telethon.sessions import StringSession
 from telethon.tl.types import Channel
 import datetime
@@ -19,74 +24,463 @@ SESSION_NAME = "iraqi_news_verifier"
 SESSION_DIR = Path("telegram_sessions")
 SESSION_FILE = SESSION_DIR / f"{SESSION_NAME}.session"
 
-async def fetch_from_channel(client, channel_username, limit):
-    """Fetch up to `limit` text messages from a public channel with pagination."""
+# Older messages per channel pulled on each sync until its history is complete
+TELEGRAM_BACKFILL = int(os.getenv("TELEGRAM_BACKFILL", "0"))
+# Safety cap on new messages per channel in one incremental sync
+TELEGRAM_MAX_DELTA = int(os.getenv("TELEGRAM_MAX_DELTA", "1000"))
+
+# Request scheduling: channels fetched at once, the account's request rate
+# (token bucket: sustained requests/second and burst size), retries of
+# transient failures, and the longest FloodWait we sleep through before
+# giving up on a channel for this run.
+TELEGRAM_CONCURRENCY = int(os.getenv("TELEGRAM_CONCURRENCY", "4"))
+TELEGRAM_RATE = float(os.getenv("TELEGRAM_RATE", "3"))
+TELEGRAM_BURST = int(os.getenv("TELEGRAM_BURST", "5"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+TELEGRAM_MAX_FLOOD_WAIT = int(os.getenv("TELEGRAM_MAX_FLOOD_WAIT", "300"))
+
+# Live ingestion: queued messages are stored every LIVE_BATCH_SIZE messages
+# or LIVE_FLUSH_MS milliseconds, whichever comes first. A full queue makes the
+# update handler wait (backpressure) rather than drop messages.
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "1000"))
+LIVE_BATCH_SIZE = int(os.getenv("LIVE_BATCH_SIZE", "32"))
+LIVE_FLUSH_MS = float(os.getenv("LIVE_FLUSH_MS", "2000"))
+
+
+class TokenBucket:
+    """Async token bucket shared by every request of one Telegram account.
+    A FloodWait pauses the whole bucket, since the limit applies to the
+    account, not to the channel that happened to hit it.
+    """
+
+    def __init__(self, rate: float = TELEGRAM_RATE, burst: int = TELEGRAM_BURST):
+        self.rate = max(rate, 1e-3)
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._stamp = time.monotonic()
+        self._paused_until = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+
+_bucket = TokenBucket()
+
+# Per-channel outcome of the most recent get_telegram_messages() run
+last_sync_stats = {}
+
+
+def _new_stats():
+    return {"status": "pending", "messages": 0, "requests": 0, "retries": 0,
+            "flood_waits": 0, "flood_wait_seconds": 0.0, "elapsed": 0.0, "error": None}
+
+
+async def _request(stats, fn, *args, **kwargs):
+    """Run one Telegram API call under the account's rate limit. FloodWait is
+    slept through (with jitter, pausing all channels) and transient network or
+    server errors are retried with jittered exponential backoff.
+    """
+    attempt = 0
+    while True:
+        await _bucket.acquire()
+        stats["requests"] += 1
+        try:
+            return await fn(*args, **kwargs)
+        except FloodWaitError as e:
+            stats["flood_waits"] += 1
+            if e.seconds > TELEGRAM_MAX_FLOOD_WAIT or stats["flood_waits"] > TELEGRAM_MAX_RETRIES:
+                raise
+            wait = e.seconds + random.uniform(1, 1 + 0.1 * e.seconds)
+            stats["flood_wait_seconds"] += wait
+            print(f"  - [WAIT] FloodWait {e.seconds}s; pausing requests for {wait:.1f}s")
+            _bucket.pause(wait)
+        except (OSError, asyncio.TimeoutError, ServerError) as e:
+            attempt += 1
+            if attempt > TELEGRAM_MAX_RETRIES:
+                raise
+            stats["retries"] += 1
+            delay = min(30.0, 2 ** attempt) * random.uniform(0.5, 1.5)
+            print(f"  - [RETRY] {type(e).__name__}: {e}; retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+def _to_article(channel_username, message):
+    """Article dict for a text message, or None. The channel and message_id
+    fields let upsert_articles advance the channel's sync state.
+    """
+    if not (message and getattr(message, "text", None)):
+        return None
+    url = f"https://t.me/{channel_username}/{message.id}"
+    parts = message.text.split('\n', 1)
+    title = parts[0]
+    body = parts[1] if len(parts) > 1 else title
+    return {
+        "title": title,
+        "body": body,
+        "url": url,
+        "date": message.date.strftime("%Y-%m-%d %H:%M:%S"),
+        "channel": channel_username,
+        "message_id": message.id,
+    }
+
+
+def _load_state(channel_username):
+    """Stored sync state, or None when the vector store is not initialized
+    (standalone runs), in which case the channel is fetched in full.
+    """
+    try:
+        from vector_store import get_channel_state
+        return get_channel_state(channel_username)
+    except RuntimeError:
+        return None
+
+
+def _skip_textless(channel_username, msgs, articles, newer):
+    """A page without any text message stores nothing, so nothing would move
+    the sync mark past it; advance it directly to avoid refetching it forever.
+    """
+    if msgs and not articles:
+        from vector_store import update_channel_state
+        ids = [m.id for m in msgs]
+        if newer:
+            update_channel_state(channel_username, last_id=max(ids))
+        else:
+            update_channel_state(channel_username, oldest_id=min(ids))
+
+
+async def _fetch_newest(client, entity, limit, stats, min_id=0):
+    """Up to `limit` newest messages with id above `min_id`, paging backwards
+    from the latest."""
+    messages = []
+    total_limit = max(1, int(limit))
+    offset_id = 0
+    while len(messages) < total_limit:
+        batch_size = min(100, total_limit - len(messages))
+        msgs = await _request(
+            stats, client.get_messages, entity, limit=batch_size, offset_id=offset_id, min_id=min_id
+        )
+        if not msgs:
+            break
+        messages.extend(msgs)
+        if len(msgs) < batch_size:
+            break
+        offset_id = msgs[-1].id
+    return messages
+
+
+async def fetch_from_channel(client, channel_username, limit, backfill=0, stats=None, entities=None):
+    """Fetch new text messages from a public channel.
+
+    With stored sync state every message newer than the channel's last seen
+    id is requested, newest first (min_id), up to TELEGRAM_MAX_DELTA; a longer
+    gap keeps only the newest ones. A channel never synced gets its `limit`
+    newest messages. With `backfill` > 0, up to that
+    many messages older than the oldest stored one are fetched too, until the
+    start of the channel's history is reached.
+
+    Outcome counters (status, requests, retries, flood waits) are written to
+    `stats` when given. `entities` caches resolved channels across calls.
+    """
+    stats = _new_stats() if stats is None else stats
+    started = time.monotonic()
     channel_articles = []
     try:
-        entity = await client.get_entity(channel_username)
-
-        total_limit = max(1, int(limit))
-        offset_id = 0
-        fetched_total = 0
-        while fetched_total < total_limit:
-            batch_size = min(100, total_limit - fetched_total)
-            msgs = await client.get_messages(entity, limit=batch_size, offset_id=offset_id)
+        entity = entities.get(channel_username) if entities is not None else None
+        if entity is None:
+            entity = await _request(stats, client.get_entity, channel_username)
+            if entities is not None:
+                entities[channel_username] = entity
+        state = _load_state(channel_username)
+
+        if state and state["last_id"]:
+            msgs = await _fetch_newest(client, entity, TELEGRAM_MAX_DELTA, stats, min_id=state["last_id"])
+            if len(msgs) >= TELEGRAM_MAX_DELTA:
+                print(
+                    f"  - [WARN] {channel_username}: {TELEGRAM_MAX_DELTA}+ new messages since the last sync, "
+                    f"older ones in the gap are skipped"
+                )
+            new_articles = [a for a in (_to_article(channel_username, m) for m in msgs) if a]
+            _skip_textless(channel_username, msgs, new_articles, newer=True)
+            channel_articles.extend(new_articles)
+        else:
+            msgs = await _fetch_newest(client, entity, limit, stats)
+            channel_articles.extend(a for a in (_to_article(channel_username, m) for m in msgs) if a)
+
+        if backfill > 0 and state and state["oldest_id"] and not state["backfill_done"]:
+            msgs = await _request(stats, client.get_messages, entity, limit=int(backfill), offset_id=state["oldest_id"])
             if not msgs:
-                break
-
-            for message in msgs:
-                if message and getattr(message, "text", None):
-                    url = f"https://t.me/{channel_username}/{message.id}"
-                    parts = message.text.split('\n', 1)
-                    title = parts[0]
-                    body = parts[1] if len(parts) > 1 else title
-                    channel_articles.append({
-                        "title": title,
-                        "body": body,
-                        "url": url,
-                        "date": message.date.strftime("%Y-%m-%d %H:%M:%S"),
-                    })
-
-            fetched = len(msgs)
-            fetched_total += fetched
-            offset_id = msgs[-1].id
+                from vector_store import update_channel_state
+                update_channel_state(channel_username, backfill_done=True)
+                print(f"  - [OK] Backfill of {channel_username} reached the start of its history")
+            old_articles = [a for a in (_to_article(channel_username, m) for m in msgs) if a]
+            _skip_textless(channel_username, msgs, old_articles, newer=False)
+            channel_articles.extend(old_articles)
 
         print(f"  - [OK] Fetched {len(channel_articles)} messages from {channel_username}")
+        stats.update(status="ok", messages=len(channel_articles))
         return channel_articles
     except ValueError:
         print(f"  - [ERROR] Channel '{channel_username}' not found or access denied.")
+        stats.update(status="not_found", error="not found or access denied")
+        return []
+    except FloodWaitError as e:
+        print(f"  - [ERROR] {channel_username} skipped: FloodWait of {e.seconds}s exceeds the limit")
+        stats.update(status="flood_wait", error=f"FloodWait {e.seconds}s")
         return []
     except Exception as e:
         print(f"  - [ERROR] Unexpected error with {channel_username}: {e}")
+        stats.update(status="error", error=str(e))
         return []
+    finally:
+        stats["elapsed"] = round(time.monotonic() - started, 2)
 
-async def get_telegram_messages(limit_per_channel=10):
-    """Connects to Telegram and fetches recent messages from all trusted channels concurrently."""
+def _print_sync_summary(all_stats):
+    by_status = {}
+    for st in all_stats.values():
+        by_status[st["status"]] = by_status.get(st["status"], 0) + 1
+    print(
+        f"Telegram sync: {sum(st['messages'] for st in all_stats.values())} messages, "
+        f"{sum(st['requests'] for st in all_stats.values())} requests, "
+        f"{sum(st['flood_waits'] for st in all_stats.values())} flood waits; "
+        + ", ".join(f"{k}={v}" for k, v in sorted(by_status.items()))
+    )
+    for username, st in all_stats.items():
+        if st["status"] != "ok":
+            print(f"  - {username}: {st['status']} ({st['error']})")
 
-    if TG_STRING_SESSION:
-        client = TelegramClient(StringSession(TG_STRING_SESSION), TG_API_ID, TG_API_HASH)
-    else:
-        SESSION_DIR.mkdir(parents=True, exist_ok=True)
-        client = TelegramClient(str(SESSION_FILE), TG_API_ID, TG_API_HASH)
 
-    try:
-        await client.start()
-        print("Telegram client connected successfully.")
+class TelegramService:
+    """Long-lived Telegram connection for one process (API or Streamlit).
 
-        print("Successfully connected to Telegram. Starting concurrent fetch...")
+    The client lives on a dedicated event loop in a daemon thread, so it
+    connects (and logs in) once and keeps its resolved channel entities,
+    whichever thread or loop the caller runs on. fetch() blocks the calling
+    thread; afetch() awaits from any other event loop.
+    """
 
-        tasks = [fetch_from_channel(client, username, limit_per_channel) for username in TRUSTED_CHANNELS]
-        results = await asyncio.gather(*tasks)
-        all_articles = [article for sublist in results for article in sublist]
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="telegram", daemon=True)
+        self._thread.start()
+        self.client = None
+        self.entities = {}
+        self.last_stats = {}
+        self._lock = None  # asyncio.Lock, created on the service loop
+        self._live = None  # (handler, queue, consumer task) while live
+        self._live_stats = {"running": False, "received": 0, "batches": 0, "stored": 0, "errors": 0}
 
-        return all_articles
-    
-    except Exception as e:
-        print(f"Error connecting to Telegram: {e}")
-        return []
-    
-    finally:
-        await client.disconnect()
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _ensure_connected(self):
+        if self.client is None:
+            if TG_STRING_SESSION:
+                client = TelegramClient(StringSession(TG_STRING_SESSION), TG_API_ID, TG_API_HASH)
+            else:
+                SESSION_DIR.mkdir(parents=True, exist_ok=True)
+                client = TelegramClient(str(SESSION_FILE), TG_API_ID, TG_API_HASH)
+            try:
+                await client.start()
+            except BaseException:
+                # Kept only once signed in, so the next call runs start() again
+                # instead of reconnecting an unauthorized client
+                await client.disconnect()
+                raise
+            self.client = client
+            print("Telegram client connected successfully.")
+        elif not self.client.is_connected():
+            await self.client.connect()
+            print("Telegram client reconnected.")
+        return self.client
+
+    async def _fetch(self, limit_per_channel, backfill):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # One sync at a time per account; a second caller waits for the first
+        async with self._lock:
+            try:
+                client = await self._ensure_connected()
+            except Exception as e:
+                print(f"Error connecting to Telegram: {e}")
+                return []
+
+            print("Starting concurrent fetch...")
+            all_stats = {username: _new_stats() for username in TRUSTED_CHANNELS}
+            slots = asyncio.Semaphore(TELEGRAM_CONCURRENCY)
+
+            async def fetch(username):
+                async with slots:
+                    return await fetch_from_channel(
+                        client, username, limit_per_channel, backfill, all_stats[username], self.entities
+                    )
+
+            results = await asyncio.gather(*[fetch(username) for username in TRUSTED_CHANNELS])
+            all_articles = [article for sublist in results for article in sublist]
+
+            self.last_stats = all_stats
+            last_sync_stats.clear()
+            last_sync_stats.update(all_stats)
+            _print_sync_summary(all_stats)
+            return all_articles
+
+    def fetch(self, limit_per_channel=10, backfill=TELEGRAM_BACKFILL):
+        """Fetch new messages from all trusted channels (blocking)."""
+        return self._submit(self._fetch(limit_per_channel, backfill)).result()
+
+    async def afetch(self, limit_per_channel=10, backfill=TELEGRAM_BACKFILL):
+        """fetch() for callers running their own event loop."""
+        return await asyncio.wrap_future(self._submit(self._fetch(limit_per_channel, backfill)))
+
+    # --- live ingestion ---
+    async def _start_live(self, sink):
+        if self._live is not None:
+            return
+        client = await self._ensure_connected()
+        names = {}
+        for username in TRUSTED_CHANNELS:
+            entity = self.entities.get(username)
+            if entity is None:
+                try:
+                    entity = await _request(_new_stats(), client.get_entity, username)
+                except Exception as e:
+                    print(f"  - [LIVE] Not listening to {username}: {e}")
+                    continue
+                self.entities[username] = entity
+            names[entity.id] = username
+        queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+
+        async def on_message(event):
+            username = names.get(getattr(event.message.peer_id, "channel_id", None))
+            article = _to_article(username, event.message) if username else None
+            if article is None:
+                return
+            # Without message_id the article does not move the channel's sync
+            # mark: a message missed while disconnected is still picked up by
+            # the next incremental fetch instead of being skipped over.
+            del article["message_id"]
+            self._live_stats["received"] += 1
+            await queue.put(article)
+
+        handler = (on_message, events.NewMessage(chats=list(self.entities[n] for n in names.values())))
+        client.add_event_handler(*handler)
+        consumer = asyncio.ensure_future(self._consume(queue, sink))
+        self._live = (handler, queue, consumer)
+        self._live_stats["running"] = True
+        print(f"Live ingestion listening to {len(names)} channels.")
+
+    async def _consume(self, queue, sink):
+        """Micro-batch queued articles into `sink` (run off the loop, since it
+        embeds and writes to SQLite).
+        """
+        while True:
+            batch = [await queue.get()]
+            deadline = self.loop.time() + LIVE_FLUSH_MS / 1000.0
+            while len(batch) < LIVE_BATCH_SIZE:
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self.loop.run_in_executor(None, sink, batch)
+                self._live_stats["batches"] += 1
+                self._live_stats["stored"] += len(batch)
+            except Exception as e:
+                self._live_stats["errors"] += 1
+                print(f"  - [LIVE] Failed to store {len(batch)} messages: {e}")
+
+    async def _stop_live(self):
+        if self._live is None:
+            return
+        handler, queue, consumer = self._live
+        self._live = None
+        self.client.remove_event_handler(*handler)
+        consumer.cancel()
+        self._live_stats["running"] = False
+
+    def start_live(self, sink=None):
+        """Start storing new messages of the trusted channels as they arrive.
+        `sink` receives each micro-batch (default: vector_store.upsert_articles).
+        """
+        if sink is None:
+            from vector_store import upsert_articles
+            sink = upsert_articles
+        self._submit(self._start_live(sink)).result()
+
+    def stop_live(self):
+        self._submit(self._stop_live()).result()
+
+    def live_stats(self):
+        queued = self._live[1].qsize() if self._live is not None else 0
+        return {**self._live_stats, "queued": queued}
+
+    def close(self):
+        """Disconnect and stop the service loop."""
+        async def disconnect():
+            await self._stop_live()
+            if self.client is not None:
+                await self.client.disconnect()
+        try:
+            self._submit(disconnect()).result(timeout=10)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=10)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_telegram_service():
+    """The process-wide TelegramService, created on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TelegramService()
+        return _service
+
+
+def telegram_stats():
+    """Per-channel outcome of the last sync, and live ingestion counters."""
+    service = _service
+    return {"sync": dict(last_sync_stats), "live": service.live_stats() if service is not None else None}
+
+
+def shutdown_telegram_service():
+    """Close the shared service if one was started."""
+    global _service
+    with _service_lock:
+        service, _service = _service, None
+    if service is not None:
+        service.close()
+
+
+async def get_telegram_messages(limit_per_channel=10, backfill=TELEGRAM_BACKFILL):
+    """Fetches new messages from all trusted channels concurrently over the
+    shared TelegramService connection.
+
+    Only messages newer than each channel's stored sync state are fetched;
+    `backfill` bounds how many older messages per channel are pulled per run.
+    At most TELEGRAM_CONCURRENCY channels are fetched at once and all requests
+    share the account's token bucket; per-channel outcomes are kept in
+    `last_sync_stats`.
+    """
+    return await get_telegram_service().afetch(limit_per_channel, backfill)
 
 # This allows running the file directly for testing purposes
 if __name__ == "__main__":
@@ -1,20 +1,47 @@
 import os
 import sqlite3
 import json
+import hashlib
 import re
-from typing import List, Dict, Tuple
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Dict, Tuple
 
 import numpy as np
 import torch
 from transformers import AutoTokenizer, AutoModel
 
+from query_cache import LRUCache
+
 _conn: sqlite3.Connection | None = None
 _tokenizer = None
 _model = None
+_model_name = ""
+_index: "VectorIndex | None" = None
+_lexical: "LexicalIndex | None" = None
+_fts_enabled = False
+
+# Schema versions are stored in SQLite's `PRAGMA user_version`:
+#   0/1 -> embeddings stored as JSON text (legacy)
+#   2   -> embeddings stored as raw little-endian float32 BLOBs
+#   3   -> adds articles.content_hash to skip re-embedding unchanged rows
+#   4   -> adds the article_tokens side table (precomputed lexical tokens)
+#   5   -> adds the articles_fts FTS5 table used for BM25 retrieval
+#   6   -> adds articles.embedding_q (compact codes) and the store_meta table
+#   7   -> adds the channel_state table (Telegram sync high-water marks)
+SCHEMA_VERSION = 7
+_EMB_DTYPE = np.dtype("<f4")
+
+# In-memory/first-pass representation of the embeddings: "float32", "float16"
+# or "int8". The full-precision float32 `embedding` column is always kept and
+# used to rescore the top candidates when a compact format is selected.
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "float32").lower()
+RESCORE_OVERSAMPLE = int(os.getenv("RESCORE_OVERSAMPLE", "2"))
 
 
 def init_vector_store(db_name: str = "vectors.db", model_name: str = "asafaya/bert-base-arabic"):
-    global _conn, _tokenizer, _model
+    global _conn, _tokenizer, _model, _model_name, _index, _lexical, _fts_enabled
 
     # Initialize SQLite
     _conn = sqlite3.connect(db_name, check_same_thread=False)
@@ -26,16 +53,838 @@ def init_vector_store(db_name: str = "vectors.db", model_name: str = "asafaya/be
             title TEXT NOT NULL,
             body TEXT NOT NULL,
             date TEXT,
-            embedding TEXT NOT NULL
+            embedding BLOB NOT NULL,
+            content_hash TEXT,
+            embedding_q BLOB
+        )
+        """
+    )
+    cur.execute("CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    # Per-channel Telegram sync state: newest and oldest stored message ids
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS channel_state (
+            channel TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            oldest_id INTEGER NOT NULL DEFAULT 0,
+            backfill_done INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        )
+        """
+    )
+    # Normalized, alias-expanded token sets keyed by articles.rowid
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS article_tokens (
+            article_id INTEGER PRIMARY KEY,
+            tokens TEXT NOT NULL
         )
         """
     )
+    # Full-text index over normalized, alias-expanded text for BM25 ranking
+    try:
+        cur.execute("CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(content)")
+        _fts_enabled = True
+    except sqlite3.OperationalError as e:
+        print(f"VectorStore: FTS5 unavailable, BM25 stage disabled: {e}")
+        _fts_enabled = False
     _conn.commit()
+    migrated = _migrate_schema(_conn)
+
+    # Load every stored embedding into the configured search index
+    index_path = _index_path(db_name)
+    if migrated and os.path.exists(index_path):
+        # VACUUM may renumber rowids, so a persisted index is no longer valid
+        os.remove(index_path)
+    if EMBEDDING_STORAGE != "float32":
+        _sync_quantized(_conn, EMBEDDING_STORAGE)
+    if EMBEDDING_MMAP and VECTOR_INDEX == "exact":
+        _index = MappedEmbeddingMatrix(db_name, _mmap_path(db_name), EMBEDDING_STORAGE)
+        _index.open(lambda: _read_embeddings(_conn, EMBEDDING_STORAGE))
+        # Rows committed to SQLite by a writer that died before appending
+        known = set(_index._pos)
+        missing = [r[0] for r in cur.execute("SELECT rowid FROM articles") if r[0] not in known]
+        if missing:
+            _index.upsert_codes(*_read_embeddings(_conn, EMBEDDING_STORAGE, missing))
+    else:
+        if EMBEDDING_MMAP:
+            print("VectorStore: EMBEDDING_MMAP only applies to VECTOR_INDEX=exact; loading into memory.")
+        _index = make_index(VECTOR_INDEX, index_path, EMBEDDING_STORAGE)
+        _load_embeddings(_conn, _index, EMBEDDING_STORAGE)
+    _index.save()
+    print(f"VectorStore: loaded {len(_index)} {EMBEDDING_STORAGE} embeddings into {_index.name} index.")
+
+    _lexical = LexicalIndex()
+    _backfill_tokens(_conn)
+    _sync_alias_fingerprint(_conn)
+    for rid, tokens in cur.execute("SELECT article_id, tokens FROM article_tokens"):
+        _lexical.upsert(rid, tokens.split())
+    if isinstance(_index, MappedEmbeddingMatrix):
+        # Rows another process rewrites are reloaded by _load_tokens()
+        _index.on_changed = _lexical.discard
 
     # Load AraBERT tokenizer and model (no sentence-transformers dependency)
     _tokenizer = AutoTokenizer.from_pretrained(model_name)
     _model = AutoModel.from_pretrained(model_name)
     _model.eval()
+    _model_name = model_name
+
+
+def _pack_embedding(vec) -> bytes:
+    """Serialize a vector as raw little-endian float32 bytes."""
+    return np.asarray(vec, dtype=_EMB_DTYPE).tobytes()
+
+
+def _unpack_embedding(blob: bytes) -> np.ndarray:
+    """Zero-copy view of a stored float32 BLOB."""
+    return np.frombuffer(blob, dtype=_EMB_DTYPE)
+
+
+def _pack_quantized(codes: np.ndarray, scale: float, storage: str) -> bytes:
+    """Serialize compact codes: int8 rows are prefixed with their float32 scale."""
+    if storage == "int8":
+        return np.float32(scale).astype(_EMB_DTYPE).tobytes() + codes.astype(np.int8).tobytes()
+    return codes.astype("<f2").tobytes()
+
+
+def _unpack_quantized(blob: bytes, storage: str) -> Tuple[np.ndarray, float]:
+    if storage == "int8":
+        return np.frombuffer(blob, dtype=np.int8, offset=4), float(np.frombuffer(blob[:4], dtype=_EMB_DTYPE)[0])
+    return np.frombuffer(blob, dtype="<f2"), 1.0
+
+
+def _sync_quantized(conn: sqlite3.Connection, storage: str, chunk: int = 5000):
+    """Make sure every row's embedding_q holds `storage` codes, re-encoding
+    from the float32 column when the configured format changed.
+    """
+    cur = conn.cursor()
+    row = cur.execute("SELECT value FROM store_meta WHERE key = 'embedding_q_format'").fetchone()
+    where = "" if (row is None or row[0] != storage) else "WHERE embedding_q IS NULL"
+    rows = cur.execute(f"SELECT rowid, embedding FROM articles {where}")
+    encoded = 0
+    with conn:
+        while True:
+            batch = rows.fetchmany(chunk)
+            if not batch:
+                break
+            codes, scales = _quantize(np.stack([_unpack_embedding(b) for _, b in batch]), storage)
+            conn.executemany(
+                "UPDATE articles SET embedding_q = ? WHERE rowid = ?",
+                [(_pack_quantized(c, sc, storage), rid) for (rid, _), c, sc in zip(batch, codes, scales)],
+            )
+            encoded += len(batch)
+        conn.execute(
+            "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('embedding_q_format', ?)", (storage,)
+        )
+    if encoded:
+        print(f"VectorStore: encoded {encoded} embeddings as {storage}.")
+
+
+def _read_embeddings(conn: sqlite3.Connection, storage: str, row_ids: List[int] | None = None,
+                     chunk: int = 500) -> Tuple[List[int], np.ndarray | None, np.ndarray | None]:
+    """Read (rowids, codes, scales) in `storage` format for all rows, or just
+    `row_ids`. Compact formats read only the codes (see _sync_quantized); the
+    float32 column stays on disk.
+    """
+    column = "embedding" if storage == "float32" else "embedding_q"
+    cur = conn.cursor()
+    if row_ids is None:
+        rows = cur.execute(f"SELECT rowid, {column} FROM articles ORDER BY rowid").fetchall()
+    else:
+        rows = []
+        for start in range(0, len(row_ids), chunk):
+            part = list(row_ids[start:start + chunk])
+            placeholders = ",".join("?" * len(part))
+            rows += cur.execute(f"SELECT rowid, {column} FROM articles WHERE rowid IN ({placeholders})", part).fetchall()
+    if not rows:
+        return [], None, None
+    if storage == "float32":
+        vecs = np.stack([_unpack_embedding(r[1]) for r in rows])
+        return [r[0] for r in rows], vecs, np.ones(len(rows), dtype=np.float32)
+    decoded = [_unpack_quantized(r[1], storage) for r in rows]
+    codes = np.stack([c for c, _ in decoded])
+    return [r[0] for r in rows], codes, np.array([sc for _, sc in decoded], dtype=np.float32)
+
+
+def _load_embeddings(conn: sqlite3.Connection, index: "VectorIndex", storage: str):
+    ids, codes, scales = _read_embeddings(conn, storage)
+    if ids:
+        index.upsert_codes(ids, codes, scales)
+
+
+def _migrate_schema(conn: sqlite3.Connection) -> bool:
+    """Upgrade an existing vectors.db in place to SCHEMA_VERSION.
+    Returns True if stored rows were rewritten.
+    """
+    cur = conn.cursor()
+    version = cur.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return False
+
+    # v1 -> v2: convert JSON text embeddings to float32 BLOBs. The column keeps
+    # its declared TEXT affinity on old tables, but SQLite never coerces BLOBs.
+    rows = cur.execute(
+        "SELECT url, embedding FROM articles WHERE typeof(embedding) = 'text'"
+    ).fetchall()
+    if rows:
+        print(f"VectorStore: migrating {len(rows)} embeddings from JSON to BLOB...")
+    columns = {r[1] for r in cur.execute("PRAGMA table_info(articles)").fetchall()}
+    with conn:
+        for url, emb_json in rows:
+            try:
+                blob = _pack_embedding(json.loads(emb_json))
+            except Exception as e:
+                print(f"VectorStore: dropping unreadable embedding for {url}: {e}")
+                conn.execute("DELETE FROM articles WHERE url = ?", (url,))
+                continue
+            conn.execute("UPDATE articles SET embedding = ? WHERE url = ?", (blob, url))
+        # v2 -> v3: existing rows get a NULL hash and are re-embedded once
+        if "content_hash" not in columns:
+            conn.execute("ALTER TABLE articles ADD COLUMN content_hash TEXT")
+        # v3 -> v4: article_tokens is created by init and filled by _backfill_tokens
+        # v4 -> v5: articles_fts is created by init and filled by _backfill_tokens
+        # v5 -> v6: embedding_q is filled by _sync_quantized when a compact format is used
+        # v6 -> v7: channel_state is created by init; channels without a row
+        #           simply do a full first sync
+        if "embedding_q" not in columns:
+            conn.execute("ALTER TABLE articles ADD COLUMN embedding_q BLOB")
+        if rows:
+            # VACUUM below may renumber rowids, so stale token rows must go
+            conn.execute("DELETE FROM article_tokens")
+            if _fts_enabled:
+                conn.execute("DELETE FROM articles_fts")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    if rows:
+        # Reclaim the space freed by the much smaller BLOBs
+        conn.execute("VACUUM")
+        print("VectorStore: migration complete.")
+    return bool(rows)
+
+
+# ---------------- Search Indexes ---------------- #
+# VECTOR_INDEX selects the backend: "exact" (brute force, the reference) or
+# "ivf" (approximate IVF-flat, persisted next to the database).
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "exact").lower()
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+IVF_MIN_TRAIN = int(os.getenv("IVF_MIN_TRAIN", "5000"))
+# Seconds between IVF assignment saves outside of (re)training and shutdown
+IVF_SAVE_INTERVAL = float(os.getenv("IVF_SAVE_INTERVAL", "300"))
+# EMBEDDING_MMAP=1 serves the exact backend from a memory-mapped sidecar file
+# shared by every process that opens the same database.
+EMBEDDING_MMAP = os.getenv("EMBEDDING_MMAP", "0").lower() in ("1", "true", "yes")
+# Rewrite the sidecar once this fraction of its rows are superseded versions
+MMAP_COMPACT_RATIO = float(os.getenv("MMAP_COMPACT_RATIO", "0.25"))
+
+
+class VectorIndex:
+    """Interface for embedding search backends keyed by SQLite rowid."""
+
+    name = "base"
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def upsert(self, row_ids: List[int], vecs: np.ndarray):
+        """Insert new rows and replace the vectors of existing ones."""
+        raise NotImplementedError
+
+    def upsert_codes(self, row_ids: List[int], codes: np.ndarray, scales: np.ndarray):
+        """Like upsert(), for vectors already encoded in the index's storage format."""
+        raise NotImplementedError
+
+    def top_k(self, qvec: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row_ids, scores) of the k best inner products, best first."""
+        raise NotImplementedError
+
+    def top_k_many(self, qvecs: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """top_k() for each row of a (Q, dim) query matrix."""
+        return [self.top_k(q, k) for q in qvecs]
+
+    def score(self, qvec: np.ndarray, row_ids: List[int]) -> np.ndarray:
+        """Exact inner products of the query with the given (present) rows."""
+        raise NotImplementedError
+
+    def save(self):
+        """Persist index state to disk, if the backend has any."""
+
+
+class EmbeddingMatrix(VectorIndex):
+    """Contiguous N x dim matrix of embeddings with a parallel array of SQLite
+    rowids. Rows are appended into spare capacity so upserts stay cheap, and a
+    query is scored with a single matrix-vector product. This is the exact
+    reference backend.
+
+    With `storage` "float16" or "int8" the matrix holds compact codes (int8
+    with a float32 scale per row) and is scored block by block, so memory
+    drops 2x / 4x at the cost of slightly approximate scores.
+    """
+
+    name = "exact"
+
+    def __init__(self, dim: int = 768, storage: str = "float32"):
+        self.storage = storage
+        self._dtype = _STORAGE_DTYPES[storage]
+        self._lock = threading.Lock()
+        self._vecs = np.empty((0, dim), dtype=self._dtype)
+        self._scales = np.empty(0, dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._pos: Dict[int, int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def upsert(self, row_ids: List[int], vecs: np.ndarray):
+        """Replace rows whose id is already present, append the rest."""
+        self.upsert_codes(row_ids, *_quantize(vecs, self.storage))
+
+    def upsert_codes(self, row_ids: List[int], codes: np.ndarray, scales: np.ndarray):
+        """Like upsert(), for vectors already in this matrix's storage format."""
+        with self._lock:
+            if codes.shape[1] != self._vecs.shape[1]:
+                if self._size:
+                    raise ValueError(f"Embedding dim {codes.shape[1]} != stored dim {self._vecs.shape[1]}")
+                self._vecs = np.empty((0, codes.shape[1]), dtype=self._dtype)
+            for rid, code, scale in zip(row_ids, codes, scales):
+                pos = self._pos.get(int(rid))
+                if pos is None:
+                    self._reserve(self._size + 1)
+                    pos = self._size
+                    self._ids[pos] = rid
+                    self._pos[int(rid)] = pos
+                    self._size += 1
+                self._vecs[pos] = code
+                self._scales[pos] = scale
+
+    def _reserve(self, n: int):
+        # Grow geometrically; searches keep using the old buffer until swapped
+        if n <= len(self._ids):
+            return
+        cap = max(n, 2 * len(self._ids), 1024)
+        vecs = np.empty((cap, self._vecs.shape[1]), dtype=self._dtype)
+        scales = np.empty(cap, dtype=np.float32)
+        ids = np.empty(cap, dtype=np.int64)
+        vecs[: self._size] = self._vecs[: self._size]
+        scales[: self._size] = self._scales[: self._size]
+        ids[: self._size] = self._ids[: self._size]
+        self._vecs, self._scales, self._ids = vecs, scales, ids
+
+    def positions(self, row_ids: List[int]) -> np.ndarray:
+        """Matrix positions of the given rowids (all must be present)."""
+        with self._lock:
+            return np.array([self._pos[int(r)] for r in row_ids], dtype=np.int64)
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Consistent (codes, scales, row_ids) views of the filled part of the matrix."""
+        with self._lock:
+            return self._vecs[: self._size], self._scales[: self._size], self._ids[: self._size]
+
+    def decode(self, positions) -> np.ndarray:
+        """float32 vectors for the given positions (an index array or slice)."""
+        vecs, scales, _ = self.snapshot()
+        out = vecs[positions].astype(np.float32)
+        if self.storage == "int8":
+            out *= scales[positions][:, None]
+        return out
+
+    def score(self, qvec: np.ndarray, row_ids: List[int]) -> np.ndarray:
+        vecs, scales, _ = self.snapshot()
+        pos = self.positions(row_ids)
+        return _dot_codes(vecs[pos], scales[pos], qvec)
+
+    def top_k(self, qvec: np.ndarray, k: int, positions: np.ndarray | None = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row_ids, scores) of the k highest dot products, best first.
+        If `positions` is given, only those matrix rows are scored.
+        """
+        vecs, scales, ids = self.snapshot()
+        if positions is not None:
+            vecs, scales, ids = vecs[positions], scales[positions], ids[positions]
+        if not len(ids) or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return _top_k_scores(ids, _dot_codes(vecs, scales, qvec), k)
+
+    def top_k_many(self, qvecs: np.ndarray, k: int, block: int = 64) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Score a block of queries with one matrix-matrix product instead of
+        one matrix-vector product per query.
+        """
+        vecs, scales, ids = self.snapshot()
+        return _top_k_many(vecs, scales, ids, None, qvecs, k, block)
+
+
+_STORAGE_DTYPES = {"float32": np.dtype(np.float32), "float16": np.dtype(np.float16), "int8": np.dtype(np.int8)}
+
+
+def _quantize(vecs: np.ndarray, storage: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Encode float vectors as (codes, per-row scales) for the given storage."""
+    vecs = np.atleast_2d(np.asarray(vecs, dtype=np.float32))
+    if storage == "int8":
+        scales = np.abs(vecs).max(axis=1) / 127.0
+        scales = np.maximum(scales, 1e-12).astype(np.float32)
+        codes = np.rint(vecs / scales[:, None]).astype(np.int8)
+        return codes, scales
+    return vecs.astype(_STORAGE_DTYPES[storage]), np.ones(len(vecs), dtype=np.float32)
+
+
+def _dot_codes(codes: np.ndarray, scales: np.ndarray, qvec: np.ndarray, chunk: int = 16384) -> np.ndarray:
+    """Inner products of a float32 query (dim,) or query block (dim, Q) with
+    stored codes. Compact rows are widened to float32 one block at a time so
+    scoring never holds a full float32 copy of the matrix.
+    """
+    qvec = np.asarray(qvec, dtype=np.float32)
+    if codes.dtype == np.float32:
+        return codes @ qvec
+    out = np.empty((len(codes),) + qvec.shape[1:], dtype=np.float32)
+    for start in range(0, len(codes), chunk):
+        out[start:start + chunk] = codes[start:start + chunk].astype(np.float32) @ qvec
+    if codes.dtype == np.int8:
+        out *= scales.reshape((-1,) + (1,) * (qvec.ndim - 1))
+    return out
+
+
+def _top_k_many(vecs, scales, ids, dead, qvecs: np.ndarray, k: int, block: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Per-query top k for a query matrix, `block` queries per product so the
+    N x block score matrix stays bounded.
+    """
+    qvecs = np.atleast_2d(np.asarray(qvecs, dtype=np.float32))
+    live = len(ids) - (int(dead.sum()) if dead is not None else 0)
+    if not live or k <= 0:
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        return [empty] * len(qvecs)
+    out = []
+    for start in range(0, len(qvecs), block):
+        scores = _dot_codes(vecs, scales, qvecs[start:start + block].T)
+        if dead is not None:
+            scores[dead] = -np.inf
+        out.extend(_top_k_scores(ids, scores[:, j], min(k, live)) for j in range(scores.shape[1]))
+    return out
+
+
+def _top_k_scores(ids: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    k = min(k, len(scores))
+    part = np.argpartition(-scores, k - 1)[:k]
+    order = part[np.argsort(-scores[part])]
+    return ids[order].copy(), scores[order]
+
+
+def _spherical_kmeans(data: np.ndarray, n_clusters: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    """Cosine k-means on L2-normalized rows; returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _nearest_centroid(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        empty = np.bincount(assign, minlength=n_clusters) == 0
+        # Re-seed empty clusters from random points so no list goes unused
+        sums[empty] = data[rng.choice(len(data), int(empty.sum()))]
+        centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-12)
+    return centroids.astype(np.float32)
+
+
+def _nearest_centroid(vecs, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    """Nearest centroid per row of a float array or of an EmbeddingMatrix."""
+    out = np.empty(len(vecs), dtype=np.int32)
+    for start in range(0, len(vecs), chunk):
+        block = slice(start, start + chunk)
+        rows = vecs.decode(block) if isinstance(vecs, EmbeddingMatrix) else vecs[block]
+        out[block] = np.argmax(rows @ centroids.T, axis=1)
+    return out
+
+
+class IVFFlatIndex(VectorIndex):
+    """Approximate inverted-file index: vectors are bucketed by their nearest
+    k-means centroid and a query only scans the `nprobe` closest buckets.
+
+    Vectors live in an EmbeddingMatrix (also used as the exact fallback before
+    the index is trained); the centroids and rowid -> list assignments are
+    persisted to `path` so restarts don't retrain. The file is rewritten after
+    training, every IVF_SAVE_INTERVAL seconds of upserts and on close; rows
+    assigned since the last save are simply re-assigned on load.
+    """
+
+    name = "ivf"
+
+    def __init__(self, path: str | None = None, nprobe: int = IVF_NPROBE, min_train: int = IVF_MIN_TRAIN,
+                 storage: str = "float32"):
+        self.path = path
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.exact = EmbeddingMatrix(storage=storage)
+        self._lock = threading.Lock()
+        self._centroids: np.ndarray | None = None
+        self._trained_size = 0
+        self._assign = np.empty(0, dtype=np.int32)  # list id per matrix position
+        self._lists: List[np.ndarray] = []  # matrix positions per list
+        self._saved_assign: Dict[int, int] = {}
+        self._last_save = time.monotonic()
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def __len__(self) -> int:
+        return len(self.exact)
+
+    def _load(self, path: str):
+        try:
+            with np.load(path) as data:
+                self._centroids = data["centroids"]
+                self._trained_size = int(data["trained_size"])
+                self._saved_assign = dict(zip(data["row_ids"].tolist(), data["lists"].tolist()))
+            self._lists = [np.empty(0, dtype=np.int64) for _ in range(len(self._centroids))]
+        except Exception as e:
+            print(f"VectorStore: ignoring unreadable IVF index {path}: {e}")
+            self._centroids = None
+
+    def save(self):
+        if not self.path or self._centroids is None:
+            return
+        _, _, ids = self.exact.snapshot()
+        with self._lock:
+            lists = self._assign[: len(ids)].copy()
+        tmp = f"{self.path}.tmp.npz"
+        np.savez(tmp, centroids=self._centroids, trained_size=self._trained_size, row_ids=ids, lists=lists)
+        os.replace(tmp, self.path)
+        self._last_save = time.monotonic()
+
+    def upsert(self, row_ids: List[int], vecs: np.ndarray):
+        self.upsert_codes(row_ids, *_quantize(vecs, self.exact.storage))
+
+    def upsert_codes(self, row_ids: List[int], codes: np.ndarray, scales: np.ndarray):
+        self.exact.upsert_codes(row_ids, codes, scales)
+        n = len(self.exact)
+        if self._centroids is None or self._centroids.shape[1] != codes.shape[1]:
+            if n >= self.min_train:
+                self.train()
+            return
+        if n > 2 * self._trained_size:
+            # The corpus has doubled since training; refresh the centroids
+            self.train()
+            return
+
+        positions = self.exact.positions(row_ids)
+        lists = np.array(
+            [self._saved_assign.pop(int(r), -1) for r in row_ids], dtype=np.int32
+        )
+        fresh = lists < 0
+        if fresh.any():
+            lists[fresh] = _nearest_centroid(self.exact.decode(positions[fresh]), self._centroids)
+        self._place(positions, lists)
+        if time.monotonic() - self._last_save >= IVF_SAVE_INTERVAL:
+            self.save()
+
+    def _place(self, positions: np.ndarray, lists: np.ndarray):
+        """Move matrix positions into their (possibly new) lists."""
+        with self._lock:
+            if len(self._assign) < len(self.exact):
+                grown = np.full(max(len(self.exact), 2 * len(self._assign)), -1, dtype=np.int32)
+                grown[: len(self._assign)] = self._assign
+                self._assign = grown
+            old = self._assign[positions]
+            self._assign[positions] = lists
+            moved = old != lists
+            positions, lists, old = positions[moved], lists[moved], old[moved]
+            for lid in np.unique(old[old >= 0]):
+                self._lists[lid] = np.setdiff1d(self._lists[lid], positions[old == lid], assume_unique=True)
+            for lid in np.unique(lists):
+                self._lists[lid] = np.concatenate([self._lists[lid], positions[lists == lid]])
+
+    def train(self):
+        n = len(self.exact)
+        nlist = int(np.clip(4 * np.sqrt(n), 16, 4096))
+        print(f"VectorStore: training IVF index ({nlist} lists) on {n} vectors...")
+        rng = np.random.default_rng(0)
+        sample = self.exact.decode(np.sort(rng.choice(n, min(n, nlist * 64), replace=False)))
+        centroids = _spherical_kmeans(sample, nlist)
+        assign = _nearest_centroid(self.exact, centroids)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(nlist + 1))
+        with self._lock:
+            self._centroids = centroids
+            self._trained_size = n
+            self._saved_assign = {}
+            self._assign = assign
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(nlist)]
+        self.save()
+
+    def score(self, qvec: np.ndarray, row_ids: List[int]) -> np.ndarray:
+        return self.exact.score(qvec, row_ids)
+
+    def top_k(self, qvec: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self._centroids is None:
+            return self.exact.top_k(qvec, k)
+        qvec = np.asarray(qvec, dtype=np.float32)
+        probe = np.argsort(-(self._centroids @ qvec))[: self.nprobe]
+        with self._lock:
+            positions = np.concatenate([self._lists[lid] for lid in probe])
+        return self.exact.top_k(qvec, k, positions=positions)
+
+
+class MappedEmbeddingMatrix(EmbeddingMatrix):
+    """EmbeddingMatrix backed by read-only memory maps of sidecar files, so
+    several API/Streamlit processes share one copy of the vectors through the
+    OS page cache.
+
+    Layout: `<base>.<generation>.{codes,scales,ids}` hold fixed-size records
+    and are append-only. An upsert appends new records (a newer record for
+    the same rowid supersedes the old one) and bumps the committed row count
+    in the database's store_meta table. Readers compare that count and the
+    generation number on each query, map the new tail or remap entirely after
+    a compaction. Writers serialize across processes with BEGIN IMMEDIATE on
+    the database.
+    """
+
+    name = "exact-mmap"
+
+    def __init__(self, db_name: str, base_path: str, storage: str = "float32"):
+        super().__init__(storage=storage)
+        self.base_path = base_path
+        self._meta = sqlite3.connect(db_name, timeout=60, isolation_level=None, check_same_thread=False)
+        self._write_lock = threading.Lock()
+        self._gen = -1
+        self._dead = np.zeros(0, dtype=bool)
+        # Called with the rowids of records appended since the last refresh
+        # (by any process), e.g. to drop derived per-row state
+        self.on_changed = None
+
+    def __len__(self) -> int:
+        return self._size - int(self._dead[: self._size].sum())
+
+    # --- shared state ---
+    def _read_meta(self) -> Dict[str, str]:
+        rows = self._meta.execute("SELECT key, value FROM store_meta WHERE key LIKE 'emb_%'").fetchall()
+        return dict(rows)
+
+    def _write_meta(self, **values):
+        self._meta.executemany(
+            "INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)",
+            [(f"emb_{k}", str(v)) for k, v in values.items()],
+        )
+
+    def _files(self, gen: int) -> Dict[str, str]:
+        return {part: f"{self.base_path}.{gen}.{part}" for part in ("codes", "scales", "ids")}
+
+    def _map(self, path: str, dtype, shape):
+        if not shape[0]:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def refresh(self):
+        """Pick up rows appended (or a compaction done) by any process."""
+        for attempt in range(3):
+            meta = self._read_meta()
+            gen = int(meta.get("emb_generation", 0))
+            count = int(meta.get("emb_count", 0))
+            dim = int(meta.get("emb_dim", self._vecs.shape[1]))
+            if gen == self._gen and count == self._size:
+                return
+            files = self._files(gen)
+            try:
+                vecs = self._map(files["codes"], self._dtype, (count, dim))
+                scales = self._map(files["scales"], np.float32, (count,))
+                ids = self._map(files["ids"], np.int64, (count,))
+                break
+            except FileNotFoundError:
+                # Compacted away by another process since the metadata was
+                # read; the new generation is committed, so read it again
+                if attempt == 2:
+                    raise
+        with self._lock:
+            if gen != self._gen:
+                start, self._pos, dead = 0, {}, np.zeros(count, dtype=bool)
+            else:
+                start, dead = self._size, np.zeros(count, dtype=bool)
+                dead[: self._size] = self._dead[: self._size]
+            changed = ids[start:].tolist()
+            for pos, rid in enumerate(changed, start):
+                old = self._pos.get(rid)
+                if old is not None:
+                    dead[old] = True
+                self._pos[rid] = pos
+            self._vecs, self._scales, self._ids, self._dead = vecs, scales, ids, dead
+            compacted, self._gen, self._size = gen != self._gen, gen, count
+        # A compaction only rewrites rows already announced
+        if self.on_changed is not None and changed and not compacted:
+            self.on_changed(changed)
+
+    # --- writes ---
+    def open(self, loader):
+        """Attach to the sidecar, building a new generation with `loader()`
+        (-> rowids, codes, scales) if it is missing or in another format.
+        """
+        with self._write_lock:
+            self._meta.execute("BEGIN IMMEDIATE")
+            try:
+                meta = self._read_meta()
+                gen = int(meta.get("emb_generation", 0))
+                usable = (
+                    meta.get("emb_format") == self.storage
+                    and all(os.path.exists(f) for f in self._files(gen).values())
+                )
+                if not usable:
+                    print(f"VectorStore: building memory-mapped embeddings at {self.base_path}...")
+                    gen += 1
+                    ids, codes, scales = loader()
+                    self._new_generation(gen, ids, codes, scales, format=self.storage)
+                self._meta.execute("COMMIT")
+            except Exception:
+                self._meta.execute("ROLLBACK")
+                raise
+        self.refresh()
+        self._remove_old_generations()
+
+    def upsert_codes(self, row_ids: List[int], codes: np.ndarray, scales: np.ndarray):
+        if not len(row_ids):
+            return
+        with self._write_lock:
+            self._meta.execute("BEGIN IMMEDIATE")
+            try:
+                self._append(row_ids, codes, scales)
+                self._meta.execute("COMMIT")
+            except Exception:
+                self._meta.execute("ROLLBACK")
+                raise
+        self.refresh()
+        if self._dead.sum() > max(1000, MMAP_COMPACT_RATIO * self._size):
+            self.compact()
+
+    def _append(self, row_ids: List[int], codes: np.ndarray, scales: np.ndarray):
+        """Append records to the current generation; caller holds the write lock."""
+        meta = self._read_meta()
+        gen, count = int(meta["emb_generation"]), int(meta["emb_count"])
+        dim = self._write_records(gen, count, row_ids, codes, scales)
+        self._write_meta(count=count + len(row_ids), dim=dim)
+
+    def _new_generation(self, gen: int, row_ids: List[int], codes, scales, **meta):
+        """Write generation `gen` in full, then publish it with one metadata
+        write: the write connection is shared with readers in this process,
+        which must never see the new generation number before its rows.
+        """
+        for path in self._files(gen).values():
+            open(path, "wb").close()
+        if len(row_ids):
+            meta["dim"] = self._write_records(gen, 0, row_ids, codes, scales)
+        self._write_meta(generation=gen, count=len(row_ids), **meta)
+
+    def _write_records(self, gen: int, count: int, row_ids: List[int], codes: np.ndarray, scales: np.ndarray) -> int:
+        """Write records after the first `count` of generation `gen`; returns the vector dim."""
+        codes = np.ascontiguousarray(codes, dtype=self._dtype)
+        files = self._files(gen)
+        arrays = {
+            "codes": codes,
+            "scales": np.asarray(scales, dtype=np.float32),
+            "ids": np.asarray(row_ids, dtype=np.int64),
+        }
+        for part, arr in arrays.items():
+            committed = count * arr.itemsize * (arr.shape[1] if arr.ndim == 2 else 1)
+            with open(files[part], "r+b") as f:
+                if os.fstat(f.fileno()).st_size > committed:
+                    # Drop any tail a crashed writer left beyond the committed count
+                    f.truncate(committed)
+                f.seek(committed)
+                f.write(arr.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        return codes.shape[1]
+
+    def compact(self):
+        """Rewrite only the live rows into a new generation."""
+        def live_rows():
+            with self._lock:
+                keep = np.flatnonzero(~self._dead[: self._size])
+                return self._ids[keep].tolist(), np.asarray(self._vecs[keep]), np.asarray(self._scales[keep])
+
+        with self._write_lock:
+            self._meta.execute("BEGIN IMMEDIATE")
+            try:
+                self.refresh()
+                ids, codes, scales = live_rows()
+                self._new_generation(self._gen + 1, ids, codes, scales)
+                self._meta.execute("COMMIT")
+            except Exception:
+                self._meta.execute("ROLLBACK")
+                raise
+        print(f"VectorStore: compacted memory-mapped embeddings to {len(ids)} rows.")
+        self.refresh()
+        self._remove_old_generations()
+
+    def _remove_old_generations(self):
+        folder = os.path.dirname(os.path.abspath(self.base_path))
+        prefix = os.path.basename(self.base_path) + "."
+        for name in os.listdir(folder):
+            gen = name[len(prefix):].split(".", 1)[0] if name.startswith(prefix) else ""
+            # The previous generation stays until the next compaction, for
+            # readers that looked up the generation just before this one
+            if gen.isdigit() and int(gen) < self._gen - 1:
+                try:
+                    os.remove(os.path.join(folder, name))
+                except OSError:
+                    # Still mapped by another process (Windows); retry next time
+                    pass
+
+    # --- reads ---
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        self.refresh()
+        return super().snapshot()
+
+    def top_k(self, qvec: np.ndarray, k: int, positions: np.ndarray | None = None) -> Tuple[np.ndarray, np.ndarray]:
+        vecs, scales, ids = self.snapshot()
+        dead = self._dead[: len(ids)]
+        if positions is not None:
+            vecs, scales, ids, dead = vecs[positions], scales[positions], ids[positions], dead[positions]
+        if not len(ids) or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        live = int((~dead).sum())
+        if not live:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = _dot_codes(vecs, scales, qvec)
+        # Superseded records never win
+        scores[dead] = -np.inf
+        return _top_k_scores(ids, scores, min(k, live))
+
+    def top_k_many(self, qvecs: np.ndarray, k: int, block: int = 64) -> List[Tuple[np.ndarray, np.ndarray]]:
+        vecs, scales, ids = self.snapshot()
+        return _top_k_many(vecs, scales, ids, self._dead[: len(ids)], qvecs, k, block)
+
+
+def _index_path(db_name: str) -> str:
+    return f"{os.path.splitext(db_name)[0]}.ivf.npz"
+
+
+def _mmap_path(db_name: str) -> str:
+    return f"{os.path.splitext(db_name)[0]}.emb"
+
+
+def make_index(kind: str = "exact", path: str | None = None, storage: str = "float32") -> VectorIndex:
+    if storage not in _STORAGE_DTYPES:
+        raise ValueError(f"Unknown EMBEDDING_STORAGE '{storage}' (expected one of {sorted(_STORAGE_DTYPES)})")
+    if kind == "exact":
+        return EmbeddingMatrix(storage=storage)
+    if kind == "ivf":
+        return IVFFlatIndex(path, storage=storage)
+    raise ValueError(f"Unknown VECTOR_INDEX '{kind}' (expected 'exact' or 'ivf')")
+
+
+def recall_at_k(k: int = 10, n_queries: int = 100, seed: int = 0) -> float:
+    """Mean recall@k of the active index against an exact scan, using stored
+    vectors (lightly perturbed) as queries.
+    """
+    if _index is None:
+        raise RuntimeError("Vector store not initialized. Call init_vector_store() first.")
+    exact = getattr(_index, "exact", _index)
+    n = len(exact)
+    if not n:
+        return 1.0
+    rng = np.random.default_rng(seed)
+    queries = exact.decode(np.sort(rng.choice(n, min(n_queries, n), replace=False)))
+    hits = 0
+    total = 0
+    for vec in queries:
+        q = vec + rng.normal(0, 0.02, len(vec)).astype(np.float32)
+        q /= np.linalg.norm(q) + 1e-12
+        truth, _ = exact.top_k(q, k)
+        found, _ = _index.top_k(q, k)
+        hits += len(set(truth.tolist()) & set(found.tolist()))
+        total += len(truth)
+    return hits / total if total else 1.0
 
 
 # ---------------- Arabic Normalization & Tokenization ---------------- #
@@ -86,28 +935,84 @@ def _normalize_ar(text: str) -> str:
     return t
 
 
+# Normalized alias word tuple -> normalized expansion words, rebuilt by
+# load_aliases(). Lookups are O(1) per candidate n-gram.
+_ALIAS_LOOKUP: Dict[Tuple[str, ...], List[str]] = {}
+_ALIAS_MAX_WORDS = 1
+# Hash of the compiled table; stored token sets and FTS text record which
+# table they were expanded with (store_meta "alias_fingerprint")
+_ALIAS_FINGERPRINT = ""
+
+
+def _compile_aliases(aliases: Dict[str, str]):
+    global _ALIAS_LOOKUP, _ALIAS_MAX_WORDS, _ALIAS_FINGERPRINT
+    lookup: Dict[Tuple[str, ...], List[str]] = {}
+    for alias, full_name in aliases.items():
+        key = tuple(_normalize_ar(alias).split())
+        if key:
+            lookup[key] = _normalize_ar(full_name).split()
+    _ALIAS_LOOKUP = lookup
+    _ALIAS_MAX_WORDS = max((len(k) for k in lookup), default=1)
+    table = json.dumps(sorted((list(k), v) for k, v in lookup.items()), ensure_ascii=False)
+    _ALIAS_FINGERPRINT = hashlib.sha1(table.encode("utf-8")).hexdigest()[:16]
+
+
+def load_aliases(path: str):
+    """Merge aliases from a file into the built-in table and recompile it.
+
+    Accepts a JSON object {"alias": "full name", ...} or a UTF-8 text file with
+    one `alias<TAB>full name` pair per line (blank lines and # comments skipped).
+    Aliases may span several words.
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            extra = json.load(f)
+        else:
+            extra = {}
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#") or "\t" not in line:
+                    continue
+                alias, full_name = line.split("\t", 1)
+                extra[alias.strip()] = full_name.strip()
+    _NAME_ALIASES.update(extra)
+    _compile_aliases(_NAME_ALIASES)
+    print(f"VectorStore: loaded {len(extra)} aliases from {path}")
+    if _conn is not None:
+        _sync_alias_fingerprint(_conn)
+
+
+_compile_aliases(_NAME_ALIASES)
+if os.getenv("ALIASES_FILE"):
+    load_aliases(os.environ["ALIASES_FILE"])
+
+
 def _expand_aliases(text: str) -> str:
     """Expand common name aliases and synonyms in the text."""
-    normalized = _normalize_ar(text)
-    words = normalized.split()
+    words = _normalize_ar(text).split()
     expanded = []
-    
-    for word in words:
-        # Check if this word has an alias
-        found = False
-        for alias, full_name in _NAME_ALIASES.items():
-            if _normalize_ar(alias) == word:
-                # Add both the original word and the full name
-                expanded.append(word)
-                expanded.extend(_normalize_ar(full_name).split())
-                found = True
+    i = 0
+    while i < len(words):
+        # Longest multi-word alias starting at this word wins
+        for n in range(min(_ALIAS_MAX_WORDS, len(words) - i), 0, -1):
+            full_name = _ALIAS_LOOKUP.get(tuple(words[i:i + n]))
+            if full_name is not None:
+                # Add both the original words and the full name
+                expanded.extend(words[i:i + n])
+                expanded.extend(full_name)
+                i += n
                 break
-        if not found:
-            expanded.append(word)
-    
+        else:
+            expanded.append(words[i])
+            i += 1
     return " ".join(expanded)
 
 
+def normalize_query(text: str) -> str:
+    """Normalized, alias-expanded form of a query (used as a cache key)."""
+    return _expand_aliases(text)
+
+
 def _token_set(text: str) -> set:
     # First expand aliases, then normalize
     expanded = _expand_aliases(text)
@@ -115,6 +1020,147 @@ def _token_set(text: str) -> set:
     return set(toks)
 
 
+def _article_tokens(title: str, body: str) -> set:
+    return _token_set(f"{title} {body[:400]}")
+
+
+# ---------------- Lexical Token Index ---------------- #
+# Tokens present in more than this fraction of documents are too common to
+# nominate lexical candidates when FTS5 is unavailable (they still count
+# towards the Jaccard overlap).
+LEXICAL_MAX_DF = float(os.getenv("LEXICAL_MAX_DF", "0.05"))
+
+
+class LexicalIndex:
+    """In-memory inverted index (token -> rowids) over the token sets stored in
+    article_tokens, so query-time lexical scoring does no text processing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs: Dict[int, frozenset] = {}
+        self._postings: Dict[str, set] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, row_id: int) -> bool:
+        return row_id in self._docs
+
+    def discard(self, row_ids: List[int]):
+        """Forget rows whose stored tokens may have changed."""
+        with self._lock:
+            for rid in row_ids:
+                for tok in self._docs.pop(rid, ()):
+                    posting = self._postings.get(tok)
+                    if posting is not None:
+                        posting.discard(rid)
+                        if not posting:
+                            del self._postings[tok]
+
+    def upsert(self, row_id: int, tokens):
+        tokens = frozenset(tokens)
+        with self._lock:
+            old = self._docs.get(row_id, frozenset())
+            for tok in old - tokens:
+                posting = self._postings.get(tok)
+                if posting is not None:
+                    posting.discard(row_id)
+                    if not posting:
+                        del self._postings[tok]
+            for tok in tokens - old:
+                self._postings.setdefault(tok, set()).add(row_id)
+            self._docs[row_id] = tokens
+
+    def jaccard(self, q_tokens: set, row_ids: List[int]) -> List[float]:
+        """Jaccard overlap between the query tokens and each stored row."""
+        out = []
+        for rid in row_ids:
+            doc = self._docs.get(rid, frozenset())
+            inter = len(q_tokens & doc)
+            union = len(q_tokens) + len(doc) - inter
+            out.append(inter / float(union) if union else 0.0)
+        return out
+
+    def candidates(self, q_tokens: set, limit: int) -> List[int]:
+        """Rowids sharing the most selective query tokens, best first."""
+        max_df = max(1, int(LEXICAL_MAX_DF * len(self._docs)))
+        counts: Dict[int, int] = {}
+        with self._lock:
+            for tok in q_tokens:
+                posting = self._postings.get(tok)
+                if not posting or len(posting) > max_df:
+                    continue
+                for rid in posting:
+                    counts[rid] = counts.get(rid, 0) + 1
+        return sorted(counts, key=counts.get, reverse=True)[:limit]
+
+
+def _fts_text(title: str, body: str) -> str:
+    return _expand_aliases(f"{title} {body}")
+
+
+def _backfill_tokens(conn: sqlite3.Connection):
+    """Compute token sets (and FTS rows) for articles missing from article_tokens."""
+    cur = conn.cursor()
+    rows = cur.execute(
+        """
+        SELECT a.rowid, a.title, a.body FROM articles a
+        LEFT JOIN article_tokens t ON t.article_id = a.rowid
+        WHERE t.article_id IS NULL
+        """
+    ).fetchall()
+    if _fts_enabled and not rows:
+        # Databases written before schema v5 have tokens but no FTS rows
+        if cur.execute("SELECT count(*) FROM articles_fts").fetchone()[0] == 0:
+            rows = cur.execute("SELECT rowid, title, body FROM articles").fetchall()
+    if not rows:
+        return
+    print(f"VectorStore: indexing tokens for {len(rows)} articles...")
+    with conn:
+        _write_tokens(conn, [(rid, title, body) for rid, title, body in rows])
+
+
+def _sync_alias_fingerprint(conn: sqlite3.Connection):
+    """Re-expand every stored token set and FTS row when they were built with
+    a different alias table than the current one. Embeddings follow lazily:
+    the content hash covers the expanded text, so affected articles are
+    re-embedded the next time they are upserted.
+    """
+    row = conn.execute("SELECT value FROM store_meta WHERE key = 'alias_fingerprint'").fetchone()
+    if row and row[0] == _ALIAS_FINGERPRINT:
+        return
+    rows = conn.execute("SELECT rowid, title, body FROM articles").fetchall()
+    if rows:
+        print(f"VectorStore: alias table changed, re-indexing tokens for {len(rows)} articles...")
+    with conn:
+        tokens = _write_tokens(conn, rows)
+        conn.execute(
+            "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('alias_fingerprint', ?)",
+            (_ALIAS_FINGERPRINT,),
+        )
+    if _lexical is not None:
+        for (rid, _, _), toks in zip(rows, tokens):
+            _lexical.upsert(rid, toks)
+    if rows:
+        _bump_generation()
+
+
+def _write_tokens(conn: sqlite3.Connection, rows: List[Tuple[int, str, str]]) -> List[set]:
+    """Store token sets and FTS text for (rowid, title, body) rows; returns the sets."""
+    tokens = [_article_tokens(title, body) for _, title, body in rows]
+    conn.executemany(
+        "INSERT OR REPLACE INTO article_tokens (article_id, tokens) VALUES (?, ?)",
+        [(rid, " ".join(sorted(toks))) for (rid, _, _), toks in zip(rows, tokens)],
+    )
+    if _fts_enabled:
+        conn.executemany(
+            "INSERT OR REPLACE INTO articles_fts (rowid, content) VALUES (?, ?)",
+            [(rid, _fts_text(title, body)) for rid, title, body in rows],
+        )
+    return tokens
+
+
 def _mean_pool(last_hidden_state: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
     mask = attention_mask.unsqueeze(-1).expand(last_hidden_state.size()).float()
     masked = last_hidden_state * mask
@@ -123,61 +1169,446 @@ def _mean_pool(last_hidden_state: torch.Tensor, attention_mask: torch.Tensor) ->
     return summed / counts
 
 
-def _embed_text(text: str) -> List[float]:
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+_MAX_SEQ_LEN = 256
+
+
+def embed_batch(texts: List[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    """Embed many texts at once; returns an (N, hidden) float32 array of
+    L2-normalized vectors in input order.
+
+    Inputs are sorted by length so each batch is padded only to (roughly) its
+    own longest member instead of the longest text overall.
+    """
+    if not texts:
+        return np.empty((0, _model.config.hidden_size), dtype=np.float32)
     # Expand aliases first, then normalize - this helps the model understand abbreviations
-    expanded = _expand_aliases(text)
-    inputs = _tokenizer(
-        expanded,
-        max_length=256,
-        truncation=True,
-        padding=True,
-        return_tensors="pt",
-    )
-    with torch.no_grad():
-        outputs = _model(**inputs)
-        pooled = _mean_pool(outputs.last_hidden_state, inputs["attention_mask"])  # [1, hidden]
-        vec = pooled[0].cpu().numpy().astype(np.float32)
-        # L2 normalize for cosine similarity via dot product
-        norm = np.linalg.norm(vec) + 1e-12
-        vec = (vec / norm).tolist()
-        return vec
+    expanded = [_expand_aliases(t) for t in texts]
+    order = sorted(range(len(expanded)), key=lambda i: len(expanded[i]))
+    batch_size = max(1, batch_size)
+
+    out = np.empty((len(texts), _model.config.hidden_size), dtype=np.float32)
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            inputs = _tokenizer(
+                [expanded[i] for i in idx],
+                max_length=_MAX_SEQ_LEN,
+                truncation=True,
+                padding=True,
+                return_tensors="pt",
+            )
+            outputs = _model(**inputs)
+            pooled = _mean_pool(outputs.last_hidden_state, inputs["attention_mask"])  # [B, hidden]
+            out[idx] = pooled.cpu().numpy().astype(np.float32)
+    # L2 normalize for cosine similarity via dot product
+    out /= np.linalg.norm(out, axis=1, keepdims=True) + 1e-12
+    return out
+
+
+def _embed_text(text: str) -> np.ndarray:
+    return embed_batch([text])[0]
+
+
+# Query coalescing: concurrent query embeddings arriving within
+# EMBED_COALESCE_WAIT_MS of each other share one padded forward pass
+EMBED_COALESCE_WAIT_MS = float(os.getenv("EMBED_COALESCE_WAIT_MS", "5"))
+EMBED_COALESCE_MAX_BATCH = int(os.getenv("EMBED_COALESCE_MAX_BATCH", "16"))
 
 
-def upsert_articles(articles: List[Dict]):
+class _PendingBatch:
+    def __init__(self):
+        self.items: List[Tuple[str, Future]] = []
+        self.full = threading.Event()
+
+
+class EmbeddingCoalescer:
+    """Micro-batches concurrent embed() calls from worker threads.
+
+    The first caller to find no open batch becomes its leader: it waits up to
+    max_wait (or until max_batch callers have joined), runs one embed_batch()
+    for everyone, and resolves the followers' futures. No background thread;
+    with max_wait 0 or max_batch 1 every call embeds on its own.
+    """
+
+    def __init__(self, max_wait_ms: float = EMBED_COALESCE_WAIT_MS, max_batch: int = EMBED_COALESCE_MAX_BATCH):
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._lock = threading.Lock()
+        self._open: _PendingBatch | None = None
+        self.batches = 0
+        self.items = 0
+
+    def embed(self, text: str) -> np.ndarray:
+        if self.max_wait == 0 or self.max_batch == 1:
+            self._count(1)
+            return _embed_text(text)
+
+        future = Future()
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _PendingBatch()
+            batch.items.append((text, future))
+            if len(batch.items) >= self.max_batch:
+                self._open = None
+                batch.full.set()
+        if not leader:
+            return future.result()
+
+        batch.full.wait(self.max_wait)
+        with self._lock:
+            if self._open is batch:
+                self._open = None
+        self._run(batch.items)
+        return future.result()
+
+    def _run(self, items: List[Tuple[str, Future]]):
+        texts = list(dict.fromkeys(text for text, _ in items))
+        self._count(len(items))
+        try:
+            vecs = embed_batch(texts)
+        except BaseException as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+        rows = {text: vecs[i] for i, text in enumerate(texts)}
+        for text, future in items:
+            future.set_result(rows[text].copy())
+
+    def _count(self, n: int):
+        with self._lock:
+            self.batches += 1
+            self.items += n
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "queries": self.items,
+                "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000.0,
+            }
+
+
+_coalescer = EmbeddingCoalescer()
+
+
+# Query embeddings keyed by the alias-expanded, normalized query text
+_query_cache = LRUCache(
+    maxsize=int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("QUERY_CACHE_TTL", "3600")),
+)
+# Whole search() results, keyed additionally by the store generation
+_search_cache = LRUCache(
+    maxsize=int(os.getenv("SEARCH_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "300")),
+)
+
+
+def embed_query(query: str) -> np.ndarray:
+    """Embedding of a search query, served from the query cache when possible."""
+    key = _expand_aliases(query)
+    vec = _query_cache.get(key)
+    if vec is None:
+        vec = _coalescer.embed(query)
+        vec.setflags(write=False)
+        _query_cache.put(key, vec)
+    return vec
+
+
+def close_vector_store():
+    """Persist index state that is saved lazily (IVF list assignments)."""
+    if _index is not None:
+        _index.save()
+
+
+def store_generation() -> int:
+    """Counter bumped by every upsert that changes stored articles (in any
+    process sharing the database); cached search results carry it.
+    """
+    row = _conn.execute("SELECT value FROM store_meta WHERE key = 'store_generation'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def _bump_generation():
+    with _conn:
+        _conn.execute(
+            """
+            INSERT INTO store_meta (key, value) VALUES ('store_generation', '1')
+            ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+            """
+        )
+
+
+def cache_stats() -> Dict[str, Dict]:
+    """Hit/miss counters of the query embedding and search result caches."""
+    return {
+        "query_embeddings": _query_cache.stats(),
+        "search_results": _search_cache.stats(),
+        "query_batching": _coalescer.stats(),
+    }
+
+
+def _article_text(a: Dict) -> str:
+    return f"Title: {a['title']}\nBody: {a['body']}"
+
+
+def _content_hash(a: Dict) -> str:
+    """Hash of the normalized, alias-expanded title/body (the text actually
+    embedded) plus the embedding model name, so an alias table change
+    invalidates exactly the articles whose expansion it changes.
+    """
+    normalized = f"{_expand_aliases(a['title'])}\n{_expand_aliases(a['body'])}\n{_model_name}"
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def _fetch_by_url(cur: sqlite3.Cursor, column: str, urls: List[str], chunk: int = 500) -> Dict[str, object]:
+    """Map url -> `column` for the given urls that exist in the table."""
+    found: Dict[str, object] = {}
+    for start in range(0, len(urls), chunk):
+        part = urls[start:start + chunk]
+        placeholders = ",".join("?" * len(part))
+        cur.execute(f"SELECT url, {column} FROM articles WHERE url IN ({placeholders})", part)
+        found.update(cur.fetchall())
+    return found
+
+
+def upsert_articles(articles: List[Dict], batch_size: int = EMBED_BATCH_SIZE,
+                    on_embedded: Callable[[int], None] | None = None,
+                    advance_marks: bool = True) -> Dict[str, int]:
     """Insert or update a batch of articles with embeddings.
     Each article: {title, body, url, date}
+
+    Articles whose content hash matches the stored row are not re-embedded.
+    `on_embedded(n)` is called once the changed articles are embedded, before
+    they are written. With advance_marks=False Telegram sync marks are left
+    alone (see advance_channel_marks()). Returns counts: {"inserted",
+    "updated", "skipped"}.
     """
     global _conn
     if _conn is None:
         raise RuntimeError("Vector store not initialized. Call init_vector_store() first.")
 
-    cur = _conn.cursor()
-    added = 0
+    # Validate and de-duplicate by URL (the last occurrence wins, as before)
+    by_url: Dict[str, Tuple[Dict, str]] = {}
     for a in articles:
         try:
-            text = f"Title: {a['title']}\nBody: {a['body']}"
-            emb = _embed_text(text)
-            cur.execute(
+            by_url[a["url"]] = (a, _content_hash(a))
+        except Exception as e:
+            print(f"Embedding/upsert failed for {a.get('url') if isinstance(a, dict) else a}: {e}")
+
+    cur = _conn.cursor()
+    marks = _channel_marks(a for a, _ in by_url.values()) if advance_marks else {}
+    stored = _fetch_by_url(cur, "content_hash", list(by_url))
+    changed = [(a, h) for url, (a, h) in by_url.items() if stored.get(url) != h]
+    stats = {
+        "inserted": sum(1 for a, _ in changed if a["url"] not in stored),
+        "updated": sum(1 for a, _ in changed if a["url"] in stored),
+        "skipped": len(by_url) - len(changed),
+    }
+    if changed:
+        embs = embed_batch([_article_text(a) for a, _ in changed], batch_size=batch_size)
+        if on_embedded is not None:
+            on_embedded(len(embs))
+        if EMBEDDING_STORAGE == "float32":
+            packed_q = [None] * len(embs)
+        else:
+            codes, scales = _quantize(embs, EMBEDDING_STORAGE)
+            packed_q = [_pack_quantized(c, sc, EMBEDDING_STORAGE) for c, sc in zip(codes, scales)]
+        with _conn:
+            cur.executemany(
                 """
-                INSERT INTO articles (url, title, body, date, embedding)
-                VALUES (?, ?, ?, ?, ?)
+                INSERT INTO articles (url, title, body, date, embedding, content_hash, embedding_q)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
                 ON CONFLICT(url) DO UPDATE SET
                     title=excluded.title,
                     body=excluded.body,
                     date=excluded.date,
-                    embedding=excluded.embedding
+                    embedding=excluded.embedding,
+                    content_hash=excluded.content_hash,
+                    embedding_q=excluded.embedding_q
                 """,
-                (a["url"], a["title"], a["body"], a.get("date"), json.dumps(emb)),
+                [
+                    (a["url"], a["title"], a["body"], a.get("date"), _pack_embedding(emb), h, q)
+                    for (a, h), emb, q in zip(changed, embs, packed_q)
+                ],
             )
-            added += 1
-        except Exception as e:
-            print(f"Embedding/upsert failed for {a.get('url')}: {e}")
+            rowids = _fetch_by_url(cur, "rowid", [a["url"] for a, _ in changed])
+            ids = [rowids[a["url"]] for a, _ in changed]
+            tokens = _write_tokens(_conn, [(rid, a["title"], a["body"]) for rid, (a, _) in zip(ids, changed)])
+            # Sync marks advance in the same transaction that stores the messages
+            _advance_channels(cur, marks)
+        _index.upsert(ids, embs)
+        for rid, toks in zip(ids, tokens):
+            _lexical.upsert(rid, toks)
+        # Bumped only once the in-memory indexes are current, so no search can
+        # cache stale results under the new generation
+        _bump_generation()
+    elif marks:
+        with _conn:
+            _advance_channels(cur, marks)
+    print(
+        f"VectorStore: inserted {stats['inserted']}, updated {stats['updated']}, "
+        f"skipped {stats['skipped']} unchanged articles."
+    )
+    return stats
 
-    _conn.commit()
-    print(f"VectorStore: upserted {added} articles.")
+
+def _channel_marks(articles) -> Dict[str, Tuple[int, int]]:
+    """(newest, oldest) message id per channel among articles that carry
+    Telegram "channel" and "message_id" fields.
+    """
+    marks: Dict[str, Tuple[int, int]] = {}
+    for a in articles:
+        channel, msg_id = a.get("channel"), a.get("message_id")
+        if channel is None or msg_id is None:
+            continue
+        hi, lo = marks.get(channel, (msg_id, msg_id))
+        marks[channel] = (max(hi, msg_id), min(lo, msg_id))
+    return marks
+
+
+def _advance_channels(cur: sqlite3.Cursor, marks: Dict[str, Tuple[int, int]]):
+    cur.executemany(
+        """
+        INSERT INTO channel_state (channel, last_id, oldest_id, updated_at)
+        VALUES (?, ?, ?, datetime('now'))
+        ON CONFLICT(channel) DO UPDATE SET
+            last_id = MAX(last_id, excluded.last_id),
+            oldest_id = CASE WHEN oldest_id = 0 THEN excluded.oldest_id
+                             ELSE MIN(oldest_id, excluded.oldest_id) END,
+            updated_at = excluded.updated_at
+        """,
+        [(channel, hi, lo) for channel, (hi, lo) in marks.items()],
+    )
+
+
+def advance_channel_marks(articles: List[Dict]):
+    """Advance the sync marks of the Telegram channels in `articles`, for
+    callers that store one fetch in several upsert_articles(..., advance_marks=False)
+    calls: marks must only move once every message below them is stored.
+    """
+    if _conn is None:
+        raise RuntimeError("Vector store not initialized. Call init_vector_store() first.")
+    marks = _channel_marks(articles)
+    if marks:
+        with _conn:
+            _advance_channels(_conn.cursor(), marks)
+
+
+def get_channel_state(channel: str) -> Dict:
+    """Sync state of a Telegram channel: last_id (newest stored message),
+    oldest_id and backfill_done. Zeros for a channel never synced.
+    """
+    if _conn is None:
+        raise RuntimeError("Vector store not initialized. Call init_vector_store() first.")
+    row = _conn.execute(
+        "SELECT last_id, oldest_id, backfill_done FROM channel_state WHERE channel = ?", (channel,)
+    ).fetchone()
+    last_id, oldest_id, backfill_done = row or (0, 0, 0)
+    return {"last_id": last_id, "oldest_id": oldest_id, "backfill_done": bool(backfill_done)}
+
+
+def update_channel_state(channel: str, last_id: int = 0, oldest_id: int = 0, backfill_done: bool | None = None):
+    """Advance a channel's marks without storing articles, e.g. past messages
+    that have no text, or when a backfill reaches the start of the history.
+    Marks only ever move outward.
+    """
+    if _conn is None:
+        raise RuntimeError("Vector store not initialized. Call init_vector_store() first.")
+    with _conn:
+        cur = _conn.cursor()
+        if last_id or oldest_id:
+            _advance_channels(cur, {channel: (last_id, oldest_id or last_id)})
+        if backfill_done is not None:
+            cur.execute(
+                """
+                INSERT INTO channel_state (channel, backfill_done, updated_at) VALUES (?, ?, datetime('now'))
+                ON CONFLICT(channel) DO UPDATE SET backfill_done = excluded.backfill_done,
+                                                   updated_at = excluded.updated_at
+                """,
+                (channel, int(backfill_done)),
+            )
 
 
 DEFAULT_SIM_THRESHOLD = float(os.getenv("SIM_THRESHOLD", "0.45"))
+# Number of dense (and sparse) hits considered for re-ranking
+CANDIDATE_POOL = int(os.getenv("SEARCH_CANDIDATE_POOL", "64"))
+# How dense and BM25 rankings are fused: "weighted" or "rrf"
+SEARCH_FUSION = os.getenv("SEARCH_FUSION", "weighted").lower()
+BM25_WEIGHT = float(os.getenv("BM25_WEIGHT", "0.3"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+def _bm25_search(q_tokens: set, limit: int) -> Dict[int, float]:
+    """Top BM25 matches as rowid -> score (higher is better)."""
+    if not q_tokens:
+        return {}
+    if not _fts_enabled:
+        # No FTS5 in this SQLite build: fall back to token-overlap candidates
+        return {rid: 0.0 for rid in _lexical.candidates(q_tokens, limit)}
+    match = " OR ".join(f'"{tok}"' for tok in sorted(q_tokens))
+    cur = _conn.cursor()
+    cur.execute(
+        "SELECT rowid, bm25(articles_fts) FROM articles_fts WHERE articles_fts MATCH ? ORDER BY rank LIMIT ?",
+        (match, limit),
+    )
+    # SQLite's bm25() is negated so that smaller means better
+    return {rid: -score for rid, score in cur.fetchall()}
+
+
+def _load_tokens(row_ids: List[int]):
+    """Read token sets this process's lexical index lacks (rows written by
+    another process) from article_tokens."""
+    missing = [rid for rid in row_ids if rid not in _lexical]
+    if not missing:
+        return
+    placeholders = ",".join("?" * len(missing))
+    rows = _conn.execute(
+        f"SELECT article_id, tokens FROM article_tokens WHERE article_id IN ({placeholders})", missing
+    ).fetchall()
+    for rid, tokens in rows:
+        _lexical.upsert(rid, tokens.split())
+
+
+def _rescore(qvec: np.ndarray, row_ids: List[int]) -> Dict[int, float]:
+    """Exact float32 similarities for the given rows, read from SQLite."""
+    if not row_ids:
+        return {}
+    cur = _conn.cursor()
+    placeholders = ",".join("?" * len(row_ids))
+    cur.execute(f"SELECT rowid, embedding FROM articles WHERE rowid IN ({placeholders})", row_ids)
+    rows = cur.fetchall()
+    if not rows:
+        return {}
+    scores = np.stack([_unpack_embedding(b) for _, b in rows]) @ np.asarray(qvec, dtype=np.float32)
+    return dict(zip([rid for rid, _ in rows], scores.tolist()))
+
+
+def _fuse(results: List[Dict]) -> None:
+    """Set each result's "score" used for ranking from its dense and BM25 signals.
+
+    "similarity" (0.8 * cosine + 0.2 * Jaccard) stays the calibrated score the
+    relevance threshold and best similarity are computed from, in similarity
+    order; fusion only selects and orders the returned contexts.
+    """
+    if SEARCH_FUSION == "rrf":
+        by_dense = sorted(results, key=lambda r: r["similarity"], reverse=True)
+        by_sparse = sorted((r for r in results if r["bm25"] > 0), key=lambda r: r["bm25"], reverse=True)
+        for r in results:
+            r["score"] = 0.0
+        for rank, r in enumerate(by_dense, 1):
+            r["score"] += 1.0 / (RRF_K + rank)
+        for rank, r in enumerate(by_sparse, 1):
+            r["score"] += 1.0 / (RRF_K + rank)
+        return
+    max_bm25 = max((r["bm25"] for r in results), default=0.0)
+    for r in results:
+        bm25_norm = r["bm25"] / max_bm25 if max_bm25 > 0 else 0.0
+        r["score"] = (1 - BM25_WEIGHT) * r["similarity"] + BM25_WEIGHT * bm25_norm
 
 
 def search(query: str, top_k: int = 8, threshold: float = DEFAULT_SIM_THRESHOLD) -> Tuple[List[Dict], bool, float]:
@@ -188,53 +1619,95 @@ def search(query: str, top_k: int = 8, threshold: float = DEFAULT_SIM_THRESHOLD)
     if _conn is None:
         raise RuntimeError("Vector store not initialized. Call init_vector_store() first.")
 
-    qvec = np.array(_embed_text(query), dtype=np.float32)
+    cache_key = (_expand_aliases(query), top_k, threshold, store_generation())
+    cached = _search_cache.get(cache_key)
+    if cached is not None:
+        contexts, is_relevant, best_sim = cached
+        print(f"DEBUG: Search cache hit (best={best_sim:.4f}, relevant={is_relevant})")
+        return [dict(c) for c in contexts], is_relevant, best_sim
+
+    qvec = embed_query(query)
+    # Candidates are the best dense hits (one matrix-vector product) plus the
+    # best BM25 hits; only these are scored lexically and fused.
+    cand_ids, cand_scores = _index.top_k(qvec, _dense_pool(top_k))
+    return _rank(query, qvec, cand_ids, cand_scores, top_k, threshold, cache_key)
+
+
+def _dense_pool(top_k: int) -> int:
+    pool = max(top_k * 4, CANDIDATE_POOL)
+    return pool * RESCORE_OVERSAMPLE if EMBEDDING_STORAGE != "float32" else pool
+
+
+def _rank(query: str, qvec: np.ndarray, cand_ids: np.ndarray, cand_scores: np.ndarray,
+          top_k: int, threshold: float, cache_key) -> Tuple[List[Dict], bool, float]:
+    """Second stage of search(): merge dense candidates with BM25 hits, score
+    them lexically, fuse, and decide relevance. Caches the result.
+    """
     q_tokens = _token_set(query)
+    pool = max(top_k * 4, CANDIDATE_POOL)
+    quantized = EMBEDDING_STORAGE != "float32"
+    dense = dict(zip(cand_ids.tolist(), cand_scores.tolist()))
+    sparse = _bm25_search(q_tokens, pool)
+    extra = [rid for rid in sparse if rid not in dense]
+    if quantized:
+        # First pass ran on compact codes; rescore at full precision and keep
+        # the dense top `pool` plus the sparse hits
+        dense = _rescore(qvec, list(dense) + extra)
+        keep = set(sorted(dense, key=dense.get, reverse=True)[:pool]) | set(sparse)
+        dense = {rid: sim for rid, sim in dense.items() if rid in keep}
+    elif extra:
+        # BM25 hits come from SQLite and may be rows this process's index has
+        # not loaded yet (written by another process, or mid-upsert), so
+        # score them from the stored embeddings
+        dense.update(_rescore(qvec, extra))
+    if not dense:
+        return [], False, 0.0
 
+    ids = list(dense)
     cur = _conn.cursor()
-    cur.execute("SELECT url, title, body, date, embedding FROM articles")
-    rows = cur.fetchall()
-    if not rows:
-        return [], False, 0.0
+    placeholders = ",".join("?" * len(ids))
+    cur.execute(
+        f"SELECT rowid, url, title, body, date FROM articles WHERE rowid IN ({placeholders})",
+        ids,
+    )
+    rows_by_id = {r[0]: r[1:] for r in cur.fetchall()}
+    _load_tokens(ids)
 
-    sims: List[Tuple[float, Dict]] = []
-    for url, title, body, date, emb_json in rows:
-        try:
-            dvec = np.array(json.loads(emb_json), dtype=np.float32)
-            # Cosine similarity since vectors are normalized
-            sim = float(np.dot(qvec, dvec))
-            # Add simple lexical Jaccard overlap between query and doc
-            doc_tokens = _token_set(f"{title} {body[:400]}")
-            union = q_tokens | doc_tokens
-            jacc = (len(q_tokens & doc_tokens) / float(len(union))) if union else 0.0
-            combined = 0.8 * sim + 0.2 * jacc
-            sims.append(
-                (
-                    combined,
-                    {
-                        "url": url,
-                        "title": title,
-                        "body": body[:600],
-                        "date": date,
-                        "similarity": combined,
-                        "sim_raw": sim,
-                        "lexical": jacc,
-                    },
-                )
-            )
-        except Exception as e:
+    results: List[Dict] = []
+    for rid, jacc in zip(ids, _lexical.jaccard(q_tokens, ids)):
+        row = rows_by_id.get(rid)
+        if row is None:
             continue
+        url, title, body, date = row
+        sim = dense[rid]
+        results.append(
+            {
+                "url": url,
+                "title": title,
+                "body": body[:600],
+                "date": date,
+                "similarity": 0.8 * sim + 0.2 * jacc,
+                "sim_raw": sim,
+                "lexical": jacc,
+                "bm25": sparse.get(rid, 0.0),
+            }
+        )
 
-    sims.sort(key=lambda x: x[0], reverse=True)
-    top_results = sims[:top_k]
-    top_contexts = [item[1] for item in top_results]
+    # Relevance is decided on the similarity order; fusion only picks and
+    # orders the contexts, with the most similar article kept first
+    by_sim = sorted(results, key=lambda r: r["similarity"], reverse=True)
+    _fuse(results)
+    results.sort(key=lambda r: r["score"], reverse=True)
+    top_contexts = results[:top_k]
+    if top_contexts and top_contexts[0] is not by_sim[0]:
+        top_contexts = [by_sim[0]] + [r for r in top_contexts if r is not by_sim[0]][: top_k - 1]
 
     # --- Detailed Logging for Debugging ---
     is_relevant = False
     best_sim = 0.0
-    if top_results:
-        top_scores = [s[0] for s in top_results[:3]]
-        best_sim = top_scores[0] if top_scores else 0.0
+    if top_contexts:
+        top_scores = [c["similarity"] for c in by_sim[:3]]
+        best_sim = top_scores[0]
         print(f"DEBUG: Top 3 combined scores: {[f'{score:.4f}' for score in top_scores]}")
         print(f"DEBUG: Threshold is {threshold:.4f}")
         
@@ -247,4 +1720,58 @@ def search(query: str, top_k: int = 8, threshold: float = DEFAULT_SIM_THRESHOLD)
     else:
         print("DEBUG: No results found in vector store search.")
 
-    return top_contexts, is_relevant, best_sim
+    _search_cache.put(cache_key, (top_contexts, is_relevant, best_sim))
+    return [dict(c) for c in top_contexts], is_relevant, best_sim
+
+
+def search_many(queries: List[str], top_k: int = 8, threshold: float = DEFAULT_SIM_THRESHOLD) -> List[Tuple[List[Dict], bool, float]]:
+    """search() for many queries at once, results in input order.
+
+    Identical queries are searched once, uncached queries are embedded in one
+    batched pass, and dense candidates come from one matrix-matrix product
+    (per block of queries) instead of one scan per query.
+    """
+    if _conn is None:
+        raise RuntimeError("Vector store not initialized. Call init_vector_store() first.")
+
+    generation = store_generation()
+    results: Dict[str, Tuple[List[Dict], bool, float]] = {}
+    todo: Dict[str, str] = {}  # expanded query -> first original spelling
+    for query in queries:
+        key = _expand_aliases(query)
+        if key in results or key in todo:
+            continue
+        cached = _search_cache.get((key, top_k, threshold, generation))
+        if cached is not None:
+            results[key] = cached
+        else:
+            todo[key] = query
+
+    if todo:
+        keys = list(todo)
+        qvecs = np.empty((len(keys), _model.config.hidden_size), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            vec = _query_cache.get(key)
+            if vec is None:
+                missing.append(i)
+            else:
+                qvecs[i] = vec
+        if missing:
+            qvecs[missing] = embed_batch([todo[keys[i]] for i in missing])
+            for i in missing:
+                vec = qvecs[i].copy()
+                vec.setflags(write=False)
+                _query_cache.put(keys[i], vec)
+        print(f"DEBUG: search_many embedded {len(missing)} of {len(keys)} unique queries")
+
+        candidates = _index.top_k_many(qvecs, _dense_pool(top_k))
+        for i, key in enumerate(keys):
+            cand_ids, cand_scores = candidates[i]
+            results[key] = _rank(todo[key], qvecs[i], cand_ids, cand_scores, top_k, threshold, (key, top_k, threshold, generation))
+
+    out = []
+    for query in queries:
+        contexts, is_relevant, best_sim = results[_expand_aliases(query)]
+        out.append(([dict(c) for c in contexts], is_relevant, best_sim))
+    return out
@@ -0,0 +1,319 @@
+"""
+Persistent cache of LLM verdicts for repeated claims.
+
+Entries are keyed by the normalized query, the retrieved contexts (URL plus a
+hash of their text) and the LLM signature. When new or updated articles change
+the top contexts for a claim, its key changes too, so stale verdicts are never
+served; old entries simply age out through the TTL.
+
+A second, in-memory semantic cache catches rephrasings of a recent claim: a
+verdict is reused when the new query's embedding is close enough to an
+answered one and their retrieved contexts largely overlap.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from inference_pool import get_inference_executor
+from rag_arabert import (
+    agenerate_response,
+    astream_response,
+    detect_question,
+    generate_response,
+    is_error_response,
+    model_signature,
+    stream_response,
+)
+from vector_store import embed_query, normalize_query
+
+VERDICT_CACHE_DB = os.getenv("VERDICT_CACHE_DB", "verdicts.db")
+VERDICT_CACHE_TTL = float(os.getenv("VERDICT_CACHE_TTL", "86400"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2048"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MIN_OVERLAP = float(os.getenv("SEMANTIC_CACHE_MIN_OVERLAP", "0.6"))
+
+
+class VerdictCache:
+    """SQLite-backed verdict store with TTL eviction."""
+
+    def __init__(self, db_name: str = VERDICT_CACHE_DB, ttl: float = VERDICT_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_name, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS verdicts (
+                key TEXT PRIMARY KEY,
+                verdict TEXT NOT NULL,
+                is_question INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS verdicts_expiry ON verdicts (expires_at)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+
+    @staticmethod
+    def make_key(query: str, contexts: List[Dict], is_relevant: bool, model: str) -> str:
+        parts = {
+            "q": normalize_query(query),
+            "ctx": sorted(
+                f"{c.get('url', '')}#"
+                + hashlib.sha1(f"{c.get('title', '')}\n{c.get('body', '')}".encode("utf-8")).hexdigest()[:16]
+                for c in contexts
+            ),
+            "rel": bool(is_relevant),
+            "model": model,
+        }
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Tuple[str, bool] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT verdict, is_question FROM verdicts WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0], bool(row[1])
+
+    def put(self, key: str, verdict: str, is_question: bool):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO verdicts (key, verdict, is_question, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, verdict, int(is_question), now, now + self.ttl),
+            )
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._conn.execute("DELETE FROM verdicts WHERE expires_at <= ?", (now,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM verdicts")
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            size = self._conn.execute("SELECT count(*) FROM verdicts").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SemanticVerdictCache:
+    """Fixed-size ring of recently answered query embeddings. The oldest entry
+    is overwritten when full, and entries older than `ttl` never match.
+    """
+
+    def __init__(self, maxsize: int = SEMANTIC_CACHE_SIZE, ttl: float = SEMANTIC_CACHE_TTL,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD, min_overlap: float = SEMANTIC_CACHE_MIN_OVERLAP):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+        self._lock = threading.Lock()
+        self._vecs: np.ndarray | None = None
+        self._entries: List[Dict | None] = [None] * maxsize
+        self._next = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, qvec: np.ndarray, urls: set, meta: Tuple) -> Tuple[str, bool] | None:
+        """Verdict of the most similar live entry with the same `meta` (model,
+        relevance, intent) whose context URLs overlap enough with `urls`.
+        """
+        with self._lock:
+            if self._vecs is None or self.maxsize <= 0:
+                self.misses += 1
+                return None
+            sims = self._vecs @ qvec
+            now = time.time()
+            for slot in np.argsort(-sims):
+                if sims[slot] < self.threshold:
+                    break
+                entry = self._entries[slot]
+                if entry is None or entry["expires_at"] <= now or entry["meta"] != meta:
+                    continue
+                union = urls | entry["urls"]
+                overlap = len(urls & entry["urls"]) / len(union) if union else 1.0
+                if overlap >= self.min_overlap:
+                    self.hits += 1
+                    return entry["verdict"], entry["is_question"]
+            self.misses += 1
+            return None
+
+    def put(self, qvec: np.ndarray, urls: set, meta: Tuple, verdict: str, is_question: bool):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if self._vecs is None:
+                # Empty slots are zero vectors, which never reach the threshold
+                self._vecs = np.zeros((self.maxsize, len(qvec)), dtype=np.float32)
+            slot = self._next
+            self._next = (self._next + 1) % self.maxsize
+            self._vecs[slot] = qvec
+            self._entries[slot] = {
+                "urls": set(urls),
+                "meta": meta,
+                "verdict": verdict,
+                "is_question": is_question,
+                "expires_at": time.time() + self.ttl,
+            }
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": sum(1 for e in self._entries if e is not None),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "min_overlap": self.min_overlap,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_cache: VerdictCache | None = None
+_semantic = SemanticVerdictCache()
+_llm_calls = 0
+
+
+def get_verdict_cache() -> VerdictCache:
+    global _cache
+    if _cache is None:
+        _cache = VerdictCache()
+    return _cache
+
+
+def verdict_cache_stats() -> Dict:
+    """Counters for both verdict caches and the LLM calls they saved."""
+    exact = get_verdict_cache().stats()
+    semantic = _semantic.stats()
+    return {
+        "verdicts": exact,
+        "semantic_verdicts": semantic,
+        "llm_calls": _llm_calls,
+        "llm_calls_saved": exact["hits"] + semantic["hits"],
+    }
+
+
+def _lookup(user_query: str, retrieved_context: List[Dict], is_relevant: bool):
+    """Check both caches; returns (hit, miss_state) where miss_state is what
+    _store() needs once the LLM has answered.
+    """
+    global _llm_calls
+    cache = get_verdict_cache()
+    model = model_signature()
+    key = cache.make_key(user_query, retrieved_context, is_relevant, model)
+    hit = cache.get(key)
+    if hit is not None:
+        print("✓ Verdict served from cache")
+        return hit, None
+
+    qvec = embed_query(user_query)
+    urls = {c.get("url", "") for c in retrieved_context}
+    meta = (model, bool(is_relevant), detect_question(user_query))
+    hit = _semantic.get(qvec, urls, meta)
+    if hit is not None:
+        print("✓ Verdict served from semantic cache (near-duplicate claim)")
+        return hit, None
+
+    _llm_calls += 1
+    return None, (key, qvec, urls, meta)
+
+
+def _store(state, verdict: str, is_question: bool):
+    # Error responses (no LLM reachable) are never cached
+    if not is_error_response(verdict):
+        key, qvec, urls, meta = state
+        get_verdict_cache().put(key, verdict, is_question)
+        _semantic.put(qvec, urls, meta, verdict, is_question)
+
+
+def cached_generate_response(user_query: str, retrieved_context: List[Dict], is_relevant: bool) -> tuple[str, bool]:
+    """generate_response() with the exact and semantic verdict caches in front
+    of the LLM call. Error responses (no LLM reachable) are never cached.
+    """
+    hit, state = _lookup(user_query, retrieved_context, is_relevant)
+    if hit is not None:
+        return hit
+    verdict, is_question = generate_response(
+        user_query=user_query, retrieved_context=retrieved_context, is_relevant=is_relevant
+    )
+    _store(state, verdict, is_question)
+    return verdict, is_question
+
+
+async def cached_agenerate_response(user_query: str, retrieved_context: List[Dict], is_relevant: bool) -> tuple[str, bool]:
+    """Async cached_generate_response() for the API event loop."""
+    # The lookup may embed the query; keep it off the event loop
+    hit, state = await get_inference_executor().run(_lookup, user_query, retrieved_context, is_relevant)
+    if hit is not None:
+        return hit
+    verdict, is_question = await agenerate_response(
+        user_query=user_query, retrieved_context=retrieved_context, is_relevant=is_relevant
+    )
+    # SQLite write under a lock shared with pool threads: off the event loop
+    # too, but not through the bounded executor, which could reject it after
+    # the verdict is already paid for
+    await asyncio.to_thread(_store, state, verdict, is_question)
+    return verdict, is_question
+
+
+def cached_stream_response(user_query: str, retrieved_context: List[Dict], is_relevant: bool) -> tuple[Iterator[str], bool]:
+    """stream_response() behind the verdict caches: a hit is yielded as one
+    chunk, a miss is cached once the stream has been fully consumed.
+    """
+    hit, state = _lookup(user_query, retrieved_context, is_relevant)
+    if hit is not None:
+        return iter([hit[0]]), hit[1]
+    chunks, is_question = stream_response(user_query, retrieved_context, is_relevant)
+
+    def tee():
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        _store(state, "".join(parts).strip(), is_question)
+
+    return tee(), is_question
+
+
+async def cached_astream_response(user_query: str, retrieved_context: List[Dict], is_relevant: bool) -> tuple[AsyncIterator[str], bool]:
+    """Async cached_stream_response()."""
+    hit, state = await get_inference_executor().run(_lookup, user_query, retrieved_context, is_relevant)
+    if hit is not None:
+        async def once():
+            yield hit[0]
+        return once(), hit[1]
+    chunks, is_question = await astream_response(user_query, retrieved_context, is_relevant)
+
+    async def tee():
+        parts = []
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        await asyncio.to_thread(_store, state, "".join(parts).strip(), is_question)
+
+    return tee(), is_question
@@ -0,0 +1,182 @@
+"""
+Offline batch verification of a JSONL file of claims, without the API.
+
+    python verify_claims.py claims.jsonl results.jsonl --workers 8
+
+Each input line is a JSON object (or a bare JSON string). The claim text is
+taken from --text-field, or the first of claim/query_text/text/body/title;
+its id from --id-field, or id/request_id, or the line number.
+
+Results are appended to the output JSONL as each claim finishes, one object
+per line, and the output doubles as the checkpoint: rerunning the same
+command skips every claim already written, so an interrupted run resumes
+where it stopped. Failed claims (errors, no LLM reachable) are not written,
+so a rerun retries them. Throughput and latency percentiles are printed at
+the end.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+TEXT_FIELDS = ("claim", "query_text", "text", "body", "title")
+ID_FIELDS = ("id", "request_id")
+
+
+def read_claims(path: str, text_field: str | None, id_field: str | None):
+    """Yield (claim_id, text) for each usable line of the input JSONL."""
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"⚠ Skipping line {lineno}: {e}")
+                continue
+            if isinstance(record, str):
+                record = {"text": record}
+            fields = (text_field,) if text_field else TEXT_FIELDS
+            text = next((record[k] for k in fields if isinstance(record.get(k), str)), None)
+            if text is None:
+                print(f"⚠ Skipping line {lineno}: no claim text")
+                continue
+            ids = (id_field,) if id_field else ID_FIELDS
+            claim_id = next((record[k] for k in ids if record.get(k) is not None), f"line:{lineno}")
+            yield str(claim_id), text
+
+
+def is_failure(record: dict) -> bool:
+    """Results that must be retried rather than checkpointed."""
+    from rag_arabert import is_error_response
+    return record.get("status") == "error" or is_error_response(record.get("verdict") or "")
+
+
+def load_checkpoint(path: str) -> set:
+    """Ids already verified in the output file (failed records, e.g. from
+    older runs, are not counted). A torn last line (run killed mid-write) is
+    cut off so appends start on a clean line.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    good_bytes = 0
+    with open(path, "rb") as f:
+        for raw in f:
+            try:
+                record = json.loads(raw)
+                claim_id = str(record["id"])
+            except (ValueError, KeyError, TypeError):
+                break
+            if not is_failure(record):
+                done.add(claim_id)
+            good_bytes += len(raw)
+    if good_bytes < os.path.getsize(path):
+        print(f"⚠ Dropping a partial line at the end of {path}")
+        with open(path, "r+b") as f:
+            f.truncate(good_bytes)
+    return done
+
+
+def verify_one(rag, claim_id: str, text: str) -> dict:
+    start = time.perf_counter()
+    try:
+        result = rag.verify_news(text)
+    except Exception as e:
+        result = {"verdict": None, "source": None, "status": "error", "error": str(e)}
+    latency_ms = (time.perf_counter() - start) * 1000.0
+    return {"id": claim_id, "claim": text, **result, "latency_ms": round(latency_ms, 1)}
+
+
+def print_summary(latencies: list, statuses: dict, skipped: int, failed: int, elapsed: float):
+    done = len(latencies)
+    print("\n=== Verification run ===")
+    print(f"Processed: {done} claims in {elapsed:.1f}s ({done / elapsed if elapsed else 0.0:.2f} claims/s)")
+    if skipped:
+        print(f"Resumed: {skipped} claims already in the output were skipped")
+    if failed:
+        print(f"Failed: {failed} claims were not saved; rerun to retry them")
+    if statuses:
+        print("Status: " + ", ".join(f"{k}={v}" for k, v in sorted(statuses.items())))
+    if latencies:
+        p50, p90, p95, p99 = np.percentile(latencies, [50, 90, 95, 99])
+        print(f"Latency ms: p50={p50:.0f} p90={p90:.0f} p95={p95:.0f} p99={p99:.0f} max={max(latencies):.0f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Verify a JSONL file of claims against the knowledge base.")
+    parser.add_argument("input", help="JSONL of claims")
+    parser.add_argument("output", help="JSONL of results (appended; also the resume checkpoint)")
+    parser.add_argument("--workers", type=int, default=4, help="claims verified concurrently")
+    parser.add_argument("--text-field", help="field holding the claim text")
+    parser.add_argument("--id-field", help="field holding the claim id")
+    parser.add_argument("--limit", type=int, help="stop after this many new claims")
+    parser.add_argument("--restart", action="store_true", help="ignore and overwrite an existing output file")
+    args = parser.parse_args(argv)
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done = load_checkpoint(args.output)
+    if done:
+        print(f"Resuming: {len(done)} claims already verified in {args.output}")
+
+    # Imported late so --help works without loading the model
+    from rag_pipeline import RAGPipeline
+    rag = RAGPipeline()
+
+    workers = max(1, args.workers)
+    latencies, statuses, skipped, failed = [], {}, 0, 0
+    start = time.perf_counter()
+    interrupted = False
+    with open(args.output, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+
+        def drain(block_until_below: int):
+            nonlocal pending, failed
+            while len(pending) > block_until_below:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record = future.result()
+                    if is_failure(record):
+                        # Not checkpointed: the next run retries it
+                        failed += 1
+                    else:
+                        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        out.flush()
+                    latencies.append(record["latency_ms"])
+                    statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+                    if len(latencies) % 50 == 0:
+                        rate = len(latencies) / (time.perf_counter() - start)
+                        print(f"... {len(latencies)} verified ({rate:.2f} claims/s)")
+
+        try:
+            submitted = 0
+            for claim_id, text in read_claims(args.input, args.text_field, args.id_field):
+                if claim_id in done:
+                    skipped += 1
+                    continue
+                if args.limit is not None and submitted >= args.limit:
+                    break
+                done.add(claim_id)
+                pending.add(pool.submit(verify_one, rag, claim_id, text))
+                submitted += 1
+                # Keep the input streaming: only a couple of claims per worker in flight
+                drain(2 * workers)
+            drain(0)
+        except KeyboardInterrupt:
+            interrupted = True
+            print("\nInterrupted; finished results are saved, rerun to resume.")
+            for future in pending:
+                future.cancel()
+
+    print_summary(latencies, statuses, skipped, failed, time.perf_counter() - start)
+    return 130 if interrupted else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())